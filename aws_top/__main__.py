@@ -1,95 +1,51 @@
+import time
+
+STARTED = time.perf_counter()
+
 import argparse
-import collections
-
-import urwid
-
-import aws_top.signals
-from aws_top import aws
-from aws_top.popup import GenerousPopUpLauncher, RegionSelectorDialog, ServiceSelectorDialog
-from aws_top.window import StatusWindow, OptionWindow, Option, Ec2Window, S3Window, LambdaWindow
-
-
-class AwsTop:
-    def __init__(self, access_key=None, secret_key=None, session_token=None, region=None):
-        if access_key and secret_key or session_token:
-            aws.set_credentials(access_key, secret_key, session_token)
-
-        if region:
-            aws.set_region(region)
-
-        services = collections.OrderedDict({
-            'EC2': Ec2Window,
-            'S3': S3Window,
-            'Lambda': LambdaWindow,
-            'DynamoDB': None
-        })
-
-        def exit_main_loop():
-            raise urwid.ExitMainLoop()
-
-        def change_service(w, service):
-            self.service_window.original_widget = services[service]()
-
-        popup_anchor = urwid.BoxAdapter(urwid.SolidFill(), 0)
-        region_selector = RegionSelectorDialog()
-        service_selector = ServiceSelectorDialog(list(services.keys()))
-        region_popup_launcher = GenerousPopUpLauncher(popup_anchor, region_selector)
-        service_popup_launcher = GenerousPopUpLauncher(popup_anchor, service_selector)
-
-        self.status_window = StatusWindow()
-        self.service_window = urwid.Filler(list(services.values())[0](), valign=urwid.TOP)
-        self.option_window = OptionWindow(
-            [
-                Option('Help', lambda: None),
-                Option('Region', lambda: region_popup_launcher.open_pop_up()),
-                Option('Service', lambda: service_popup_launcher.open_pop_up()),
-                Option('Exit', exit_main_loop)
-            ]
-        )
-
-        urwid.connect_signal(service_selector, aws_top.signals.SERVICE_CHANGE, change_service)
-
-        # Layout:
-        # - invisible PopUp launchers
-        # - Status
-        # - Main
-        # - Options
-        self.main_win = urwid.Pile(
-            [
-                ('pack', urwid.Pile([region_popup_launcher, service_popup_launcher])),
-                ('pack', urwid.BoxAdapter(self.status_window, 1)),
-                self.service_window,
-                ('pack', urwid.BoxAdapter(self.option_window, 1))
-            ],
-            focus_item=3
-        )
-
-        palette = [
-            ('error', 'dark red', ''),
-            ('warn', 'yellow', ''),
-            ('f_key', 'bold,white', 'default'),
-            ('options_bg', 'bold', 'dark blue'),
-            ('bold', 'bold', ''),
-            ('popbg', 'white', 'dark blue')
-        ]
-
-        self.__loop = urwid.MainLoop(
-            self.main_win,
-            palette=palette,
-            pop_ups=True
-        )
-        self.__loop.screen.set_terminal_properties(colors=256)
-
-    def update_ui(self, loop, user_data=None):
-        self.status_window.update()
-        self.service_window.original_widget.update()
-
-        self.__loop.draw_screen()
-        self.__loop.set_alarm_in(1, self.update_ui)
-
-    def run(self):
-        self.__loop.set_alarm_in(1, self.update_ui)
-        self.__loop.run()
+import atexit
+import configparser
+import sqlite3
+import sys
+
+from aws_top import aws, cache, config, export, recording
+from aws_top.events import RECONCILE_INTERVAL
+from aws_top.ratelimit import DEFAULT_RATE, limiter
+from aws_top.scheduler import DEFAULT_INTERVALS
+from aws_top.startup import StartupProfile
+from aws_top.timeseries import DEFAULT_HISTORY
+
+
+def parse_seconds(value):
+    value = float(value)
+
+    if value < 0:
+        raise argparse.ArgumentTypeError('must not be negative: {:g}'.format(value))
+
+    return value
+
+
+def headless(args):
+    # exports without a terminal UI, urwid is never imported
+    aws.configure(
+        args.access_key, args.secret_key, args.session_token, args.region, args.max_pool_connections,
+        args.regions, args.all_regions, args.region_concurrency
+    )
+
+    if args.role_arns or args.profiles:
+        from aws_top import accounts
+
+        loaded, failures = accounts.load(args.role_arns, args.profiles)
+
+        for source, error in failures:
+            print('{}: {}'.format(source, error), file=sys.stderr)
+
+        if not loaded:
+            return 1
+
+        aws.set_accounts(loaded)
+
+    return export.run(args.service, args.format, args.watch, metrics_file=args.metrics_file)
 
 
 def main():
@@ -99,16 +55,140 @@ def main():
     argparser.add_argument('-s', '--secret-key')
     argparser.add_argument('-S', '--session-token')
     argparser.add_argument('-r', '--region')
+    argparser.add_argument('--regions', type=lambda value: [region.strip() for region in value.split(',')],
+                           help='comma separated regions queried in all regions mode')
+    argparser.add_argument('--all-regions', action='store_true', help='start in all regions mode')
+    argparser.add_argument('--region-concurrency', type=int, default=4,
+                           help='number of regions queried at the same time (default: 4)')
+    argparser.add_argument('--role-arn', action='append', default=[], dest='role_arns',
+                           help='role assumed to show another account, may be repeated')
+    argparser.add_argument('--profile', action='append', default=[], dest='profiles',
+                           help='named profile shown as another account, may be repeated')
+    argparser.add_argument('--no-cache', action='store_true', help='do not keep the last listings on disk')
+    argparser.add_argument('--cache-size', type=int, default=cache.DEFAULT_MAX_SIZE // (1024 * 1024),
+                           help='maximum size of the on-disk cache in MB (default: 64)')
+    argparser.add_argument('--cache-age', type=float, default=cache.DEFAULT_MAX_AGE / 86400,
+                           help='days after which cached listings are dropped (default: 7)')
+    argparser.add_argument('--max-pool-connections', type=int, default=10,
+                           help='size of the HTTP connection pool kept per AWS client')
+    argparser.add_argument('--max-calls-per-second', type=float, default=DEFAULT_RATE, metavar='CALLS',
+                           help='AWS API calls per second of the whole process, 0 for no limit '
+                                '(default: {})'.format(DEFAULT_RATE))
+    argparser.add_argument('-i', '--interval', action='append', type=config.parse_interval, default=[],
+                           metavar='SERVICE=SECONDS', help='poll interval of a service, may be repeated')
+    argparser.add_argument('-c', '--config', help='path to a config file (default: ~/.aws-top.ini)')
+    argparser.add_argument('--history', type=int,
+                           help='number of metric datapoints kept per resource (default: {})'.format(DEFAULT_HISTORY))
+    argparser.add_argument('--metrics-file',
+                           help='write API call and render statistics to this file in Prometheus text format')
+    argparser.add_argument('--startup-profile', action='store_true',
+                           help='exit once the first data is shown and print how long each startup phase took')
+
+    headless_group = argparser.add_argument_group('headless export')
+    mode = headless_group.add_mutually_exclusive_group()
+    mode.add_argument('--once', action='store_true', help='print the resources of --service to stdout and exit')
+    mode.add_argument('--watch', type=parse_seconds, metavar='SECONDS',
+                      help='print the resources of --service to stdout every SECONDS')
+    headless_group.add_argument('--service', choices=sorted(export.SERVICES), default='ec2',
+                                help='service exported by --once and --watch (default: ec2)')
+    headless_group.add_argument('--format', choices=export.FORMATS, default='jsonl',
+                                help='output format of --once and --watch (default: jsonl)')
+
+    recording_group = argparser.add_argument_group('record and replay')
+    recording_mode = recording_group.add_mutually_exclusive_group()
+    recording_mode.add_argument('--record', metavar='FILE', help='write every AWS response to FILE')
+    recording_mode.add_argument('--replay', metavar='FILE',
+                                help='answer AWS calls with the responses recorded in FILE instead of calling AWS')
+    recording_group.add_argument('--replay-timing', choices=recording.TIMINGS, default='original',
+                                 help='take as long as the recorded calls did or answer at once (default: original)')
+
+    events_group = argparser.add_argument_group('event mode')
+    events_group.add_argument('--event-queue', metavar='QUEUE_URL',
+                              help='SQS queue receiving EC2 and Lambda events from EventBridge')
+    events_group.add_argument('--event-endpoint-url', metavar='URL',
+                              help='endpoint of the event queue, e.g. a local ElasticMQ')
+    events_group.add_argument('--reconcile-interval', type=float, default=RECONCILE_INTERVAL, metavar='SECONDS',
+                              help='interval of the full listings of EC2 and Lambda with --event-queue '
+                                   '(default: {:g})'.format(RECONCILE_INTERVAL))
+
+    profile = StartupProfile(STARTED)
+    profile.mark('imports')
 
     args = argparser.parse_args()
+    limiter.set_rate(args.max_calls_per_second)
+
+    if args.record:
+        try:
+            recording.record(args.record)
+        except OSError as ex:
+            argparser.error('cannot record to {}: {}'.format(args.record, ex))
+
+        atexit.register(recording.stop)
+    elif args.replay:
+        try:
+            replayer = recording.replay(args.replay, args.replay_timing)
+        except (OSError, EOFError, ValueError) as ex:
+            argparser.error('cannot replay {}: {}'.format(args.replay, ex))
+
+        # the recorded region, responses are looked up by it
+        args.region = args.region or replayer.region
+
+    if args.once or args.watch is not None:
+        sys.exit(headless(args))
+
+    if not args.startup_profile:
+        profile = None
+
+    try:
+        settings = config.load(args.config)
+        intervals = config.get_intervals(settings, dict(args.interval), DEFAULT_INTERVALS)
+        history = args.history or settings.getint('display', 'history', fallback=DEFAULT_HISTORY)
+    except (OSError, configparser.Error, ValueError) as ex:
+        argparser.error('invalid config {}: {}'.format(args.config or config.DEFAULT_PATH, ex))
+    snapshot_cache = None
+
+    if not args.no_cache:
+        try:
+            snapshot_cache = cache.SnapshotCache(
+                max_size=args.cache_size * 1024 * 1024,
+                max_age=args.cache_age * 86400
+            )
+        except (OSError, sqlite3.Error):
+            pass
+
+    if profile:
+        profile.mark('parse arguments')
+
+    # urwid, the windows and the AWS SDK are only imported once the arguments are known to be valid
+    from aws_top.app import AwsTop
+
+    if profile:
+        profile.mark('ui imports')
 
     AwsTop(
         args.access_key,
         args.secret_key,
         args.session_token,
-        args.region
+        args.region,
+        args.max_pool_connections,
+        intervals,
+        history,
+        args.regions,
+        args.all_regions,
+        args.region_concurrency,
+        args.role_arns,
+        args.profiles,
+        snapshot_cache,
+        profile,
+        args.metrics_file,
+        args.event_queue,
+        args.event_endpoint_url,
+        args.reconcile_interval
     ).run()
 
+    if profile:
+        print(profile.report(), file=sys.stderr)
+
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+import concurrent.futures
+import threading
+
+import boto3
+import botocore.credentials
+import botocore.exceptions
+import botocore.session
+
+import aws_top.aws
+
+SESSION_NAME = 'aws-top'
+
+
+class Account:
+    def __init__(self, name, session, credentials=None, account_id=None):
+        self.name = name
+        self.session = session
+        self.credentials = credentials
+        # AWS account id, events name accounts by it
+        self.account_id = account_id
+
+    def refresh_needed(self):
+        return self.credentials is not None and self.credentials.refresh_needed()
+
+    def refresh(self):
+        # accessing frozen credentials makes botocore refresh them if they are about to expire
+        self.credentials.get_frozen_credentials()
+
+
+def account_name_from_arn(role_arn):
+    # arn:aws:iam::123456789012:role/name -> 123456789012/name
+    parts = role_arn.split(':')
+
+    if len(parts) < 6:
+        return role_arn
+
+    return '{}/{}'.format(parts[4], parts[5].split('/')[-1])
+
+
+def assume_role(role_arn, duration=3600):
+    def fetch_credentials():
+        credentials = aws_top.aws.clients.client('sts').assume_role(
+            RoleArn=role_arn,
+            RoleSessionName=SESSION_NAME,
+            DurationSeconds=duration
+        )['Credentials']
+
+        return {
+            'access_key': credentials['AccessKeyId'],
+            'secret_key': credentials['SecretAccessKey'],
+            'token': credentials['SessionToken'],
+            'expiry_time': credentials['Expiration'].isoformat()
+        }
+
+    # botocore keeps the temporary credentials until shortly before they expire and only then calls
+    # AssumeRole again, so STS is hit once per account and hour instead of once per refresh
+    credentials = botocore.credentials.RefreshableCredentials.create_from_metadata(
+        metadata=fetch_credentials(),
+        refresh_using=fetch_credentials,
+        method='sts-assume-role'
+    )
+
+    botocore_session = botocore.session.get_session()
+    botocore_session._credentials = credentials
+    botocore_session.set_config_variable('region', aws_top.aws.get_region())
+
+    return Account(
+        account_name_from_arn(role_arn),
+        boto3.Session(botocore_session=botocore_session),
+        credentials,
+        role_arn.split(':')[4] if role_arn.count(':') >= 5 else None
+    )
+
+
+def from_profile(profile):
+    session = boto3.Session(profile_name=profile, region_name=aws_top.aws.get_region())
+    # the name of a profile does not tell its account, which also checks its credentials right away
+    sts = aws_top.aws.clients.client('sts', account=profile, session=session)
+    account_id = sts.get_caller_identity()['Account']
+
+    return Account(profile, session, account_id=account_id)
+
+
+def load(role_arns=(), profiles=(), max_workers=8):
+    # returns the accounts that could be set up and (source, error) tuples for the others
+    jobs = [(assume_role, role_arn) for role_arn in role_arns] + [(from_profile, profile) for profile in profiles]
+    accounts = []
+    failures = []
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [(source, executor.submit(factory, source)) for factory, source in jobs]
+
+        for source, future in futures:
+            try:
+                accounts.append(future.result())
+            except (botocore.exceptions.ClientError, botocore.exceptions.BotoCoreError) as ex:
+                failures.append((source, ex))
+
+    return accounts, failures
+
+
+class CredentialRefresher(threading.Thread):
+    # refreshes expiring credentials in the background so that fetches never wait for STS
+
+    def __init__(self, accounts, interval=60):
+        super(CredentialRefresher, self).__init__(daemon=True)
+        self.__accounts = accounts
+        self.__interval = interval
+        self.__stopped = threading.Event()
+
+    def run(self):
+        while not self.__stopped.wait(self.__interval):
+            for account in self.__accounts:
+                if account.refresh_needed():
+                    try:
+                        account.refresh()
+                    except (botocore.exceptions.ClientError, botocore.exceptions.BotoCoreError):
+                        # the next fetch of this account reports the error
+                        pass
+
+    def stop(self):
+        self.__stopped.set()
@@ -0,0 +1,434 @@
+import collections
+import time
+
+import urwid
+
+import aws_top.signals
+from aws_top import aws, events, instrumentation
+from aws_top.popup import GenerousPopUpLauncher, RegionSelectorDialog, ServiceSelectorDialog, StatsDialog
+from aws_top.refresh import RefreshEngine
+from aws_top.scheduler import DEFAULT_INTERVALS, RefreshSchedule, is_throttling_error
+from aws_top.timeseries import DEFAULT_HISTORY
+from aws_top.window import StatusWindow, OptionWindow, Option, FilterBar, Ec2Window, S3Window, LambdaWindow, \
+    DynamoDbWindow
+
+
+class AwsTop:
+    METRICS_FILE_INTERVAL = 10
+    # seconds until the event queue is polled again after an error
+    EVENTS_RETRY_INTERVAL = 30
+
+    def __init__(self, access_key=None, secret_key=None, session_token=None, region=None,
+                 max_pool_connections=None, intervals=None, history=None, regions=None, all_regions=False,
+                 region_concurrency=None, role_arns=(), profiles=(), cache=None, profile=None, metrics_file=None,
+                 event_queue=None, event_endpoint_url=None, reconcile_interval=events.RECONCILE_INTERVAL):
+        self.__profile = profile
+        self.__metrics_file = metrics_file
+        self.__metrics_written = 0
+        self.__event_queue_url = event_queue
+        self.__event_endpoint_url = event_endpoint_url
+        self.__event_queue = None
+        self.__events_retry = 0
+
+        aws.configure(
+            access_key, secret_key, session_token, region, max_pool_connections,
+            regions, all_regions, region_concurrency
+        )
+
+        # the roles are assumed and the profiles resolved after the first draw
+        self.__role_arns = list(role_arns)
+        self.__profiles = list(profiles)
+        self.__credential_refresher = None
+
+        services = collections.OrderedDict({
+            'EC2': Ec2Window,
+            'S3': S3Window,
+            'Lambda': LambdaWindow,
+            'DynamoDB': DynamoDbWindow
+        })
+
+        def exit_main_loop():
+            raise urwid.ExitMainLoop()
+
+        intervals = intervals or DEFAULT_INTERVALS
+        self.__schedules = {
+            service: RefreshSchedule(intervals.get(service, DEFAULT_INTERVALS.get(service, 5)))
+            for service in services
+        }
+
+        # with an event queue the listings of these services only reconcile what events missed
+        if event_queue:
+            for service in events.SERVICES:
+                self.__schedules[service] = RefreshSchedule(reconcile_interval, fast_interval=reconcile_interval)
+
+        self.__history = history or DEFAULT_HISTORY
+        self.__cache = cache
+
+        # windows are kept with their data while other services are shown
+        self.__services = services
+        self.__windows = {}
+
+        def change_service(w, service):
+            previous = self.__windows.get(self.__service)
+
+            # the filter bar is cleared, so is the query of the window that is left
+            if previous is not None and previous.set_query('', apply_filters=True):
+                self.__schedules[self.__service].expedite()
+
+            self.__service = service
+            self.filter_bar.set_edit_text('')
+            self.__hide_filter_bar()
+            self.service_window.original_widget = self.__window(service)
+            self.status_window.set_refresh_status(self.__schedules[service])
+
+            if self.__schedules[service].due():
+                self.refresh()
+
+        def change_region(w, region):
+            # Every window shows the old region, they are created again when needed. Their running
+            # refreshes are cancelled, so no rows of the old region reach the new windows.
+            for window in self.__windows.values():
+                self.__engine.cancel(window)
+                self.__engine.cancel((window, 'metrics'))
+
+            self.__windows.clear()
+
+            for schedule in self.__schedules.values():
+                schedule.reset()
+
+            change_service(w, self.__service)
+
+        def create_region_selector():
+            region_selector = RegionSelectorDialog()
+            urwid.connect_signal(region_selector, aws_top.signals.REGION_CHANGE, change_region)
+
+            return region_selector
+
+        popup_anchor = urwid.BoxAdapter(urwid.SolidFill(), 0)
+        service_selector = ServiceSelectorDialog(list(services.keys()))
+        region_popup_launcher = GenerousPopUpLauncher(popup_anchor, create_region_selector)
+        service_popup_launcher = GenerousPopUpLauncher(popup_anchor, service_selector)
+        stats_popup_launcher = GenerousPopUpLauncher(popup_anchor, StatsDialog)
+
+        # service windows, the region and the caller identity are resolved after the first draw
+        self.__service = list(services.keys())[0]
+        self.status_window = StatusWindow(self.__schedules[self.__service])
+
+        if self.__role_arns or self.__profiles:
+            self.status_window.set_user('{} accounts...'.format(len(self.__role_arns) + len(self.__profiles)))
+
+        self.filter_bar = FilterBar()
+        self.service_window = urwid.WidgetPlaceholder(
+            urwid.Filler(urwid.Text(('warn', 'Starting...'), align=urwid.CENTER), valign=urwid.TOP)
+        )
+        self.option_window = OptionWindow(
+            [
+                Option('Help', lambda: None),
+                Option('Region', lambda: region_popup_launcher.open_pop_up()),
+                Option('Service', lambda: service_popup_launcher.open_pop_up()),
+                Option('Exit', exit_main_loop),
+                Option('Stats', lambda: stats_popup_launcher.open_pop_up()),
+                Option('Filter', self.__show_filter_bar)
+            ]
+        )
+
+        urwid.connect_signal(service_selector, aws_top.signals.SERVICE_CHANGE, change_service)
+        urwid.connect_signal(self.filter_bar, aws_top.signals.QUERY_CHANGE, self.__change_query)
+        urwid.connect_signal(self.filter_bar, aws_top.signals.QUERY_APPLY, self.__apply_query)
+
+        # Layout:
+        # - invisible PopUp launchers
+        # - Status
+        # - Main
+        # - Filter bar, only while open or a query is set
+        # - Options
+        self.main_win = urwid.Pile(
+            [
+                ('pack', urwid.Pile([region_popup_launcher, service_popup_launcher, stats_popup_launcher])),
+                ('pack', urwid.BoxAdapter(self.status_window, 1)),
+                self.service_window,
+                ('pack', urwid.BoxAdapter(self.option_window, 1))
+            ],
+            focus_item=2
+        )
+
+        palette = [
+            ('error', 'dark red', ''),
+            ('warn', 'yellow', ''),
+            ('f_key', 'bold,white', 'default'),
+            ('options_bg', 'bold', 'dark blue'),
+            ('bold', 'bold', ''),
+            ('popbg', 'white', 'dark blue'),
+            ('changed', 'black', 'yellow'),
+            ('selected', 'black', 'light gray')
+        ]
+
+        self.__loop = urwid.MainLoop(
+            self.main_win,
+            palette=palette,
+            pop_ups=True,
+            unhandled_input=self.__handle_input
+        )
+        self.__loop.screen.set_terminal_properties(colors=256)
+        # the event queue is long-polled on a worker of its own
+        self.__engine = RefreshEngine(self.__loop, max_workers=5 if event_queue else 4)
+        self.__mark('build ui')
+
+    def __window(self, service):
+        window = self.__windows.get(service)
+
+        if window is None:
+            window = self.__windows[service] = self.__services[service](self.__history, self.__cache)
+
+        return window
+
+    def __mark(self, phase):
+        if self.__profile and not self.__profile.has(phase):
+            self.__profile.mark(phase)
+
+    def __load_accounts(self):
+        from aws_top import accounts
+
+        return accounts.load(self.__role_arns, self.__profiles)
+
+    def __init_accounts(self, future):
+        from aws_top import accounts
+
+        loaded, failures = future.result()
+
+        if not loaded:
+            raise SystemExit('Could not access any account: {}'.format(
+                '; '.join('{}: {}'.format(source, error) for source, error in failures)
+            ))
+
+        aws.set_accounts(loaded)
+        self.__credential_refresher = accounts.CredentialRefresher(loaded)
+        self.__credential_refresher.start()
+        self.status_window.set_user('{} accounts'.format(len(loaded)))
+        self.__mark('assume roles')
+
+    def __handle_input(self, key):
+        # the service table has the focus, function keys fall through to the options
+        if key == '/':
+            self.__show_filter_bar()
+            return True
+
+        if isinstance(key, str):
+            return self.option_window.keypress((0,), key) is None
+
+        return False
+
+    def __show_filter_bar(self):
+        if self.filter_bar not in [widget for widget, options in self.main_win.contents]:
+            self.main_win.contents.insert(3, (self.filter_bar, self.main_win.options('pack')))
+
+        self.main_win.focus_position = 3
+
+    def __hide_filter_bar(self):
+        for i, (widget, options) in enumerate(self.main_win.contents):
+            if widget is self.filter_bar:
+                del self.main_win.contents[i]
+                break
+
+        self.main_win.focus_position = 2
+
+    def __change_query(self, w, text):
+        window = self.service_window.original_widget
+
+        if hasattr(window, 'set_query'):
+            window.set_query(text)
+
+    def __apply_query(self, w, text):
+        window = self.service_window.original_widget
+
+        if hasattr(window, 'set_query') and window.set_query(text, apply_filters=True):
+            self.__schedules[self.__service].expedite()
+            self.refresh()
+
+        if text:
+            self.main_win.focus_position = 2
+        else:
+            self.__hide_filter_bar()
+
+    def __start(self, loop, user_data=None):
+        self.__loop.draw_screen()
+        self.__mark('first draw')
+
+        def show():
+            self.service_window.original_widget = self.__window(self.__service)
+            self.__mark('create service window')
+            self.status_window.update()
+            self.refresh()
+            self.__loop.set_alarm_in(1, self.update_ui)
+            # the region selector lists the built-in regions until the enabled ones are known
+            self.__engine.submit(
+                'regions', lambda: aws.discover_regions(self.__cache), lambda future: None, background=True
+            )
+
+        def on_accounts(future):
+            self.__init_accounts(future)
+            show()
+
+        def on_ready(future):
+            self.__mark('load aws sdk')
+
+            # the service windows are created once the accounts they list are known
+            if self.__role_arns or self.__profiles:
+                self.__engine.submit('accounts', self.__load_accounts, on_accounts)
+            else:
+                show()
+
+        def on_user(future):
+            try:
+                self.status_window.set_user(future.result())
+            except aws.aws_errors() as ex:
+                self.status_window.set_user('unknown ({})'.format(ex))
+
+            self.__mark('caller identity')
+            self.__startup_finished()
+
+        self.__engine.submit('startup', aws.warm_up, on_ready)
+
+        if not (self.__role_arns or self.__profiles):
+            self.__engine.submit('identity', aws.get_user, on_user)
+
+    def __startup_finished(self):
+        # with --startup-profile aws-top exits once the first data and the identity are shown
+        if not self.__profile or not self.__profile.has('first data'):
+            return
+
+        if aws.get_accounts() or self.__profile.has('caller identity'):
+            raise urwid.ExitMainLoop()
+
+    def refresh(self, service=None):
+        service = service or self.__service
+        window = self.__window(service)
+        schedule = self.__schedules[service]
+
+        def on_result(future):
+            window.apply(future)
+            # with several regions or accounts a throttled one is only a partial failure
+            throttled = [failure.error for failure in window.failures if is_throttling_error(failure.error)]
+
+            if future.exception():
+                schedule.failed(future.exception())
+            elif throttled:
+                schedule.failed(throttled[0])
+            else:
+                schedule.succeeded(window.transitioning)
+
+            self.status_window.update()
+
+            if window is self.service_window.original_widget:
+                self.__mark('first data')
+                self.__startup_finished()
+
+        # services that are not shown are prefetched with a lower priority
+        background = service != self.__service
+
+        if self.__engine.submit(window, window.fetch, on_result, window.add_page, background=background):
+            schedule.started()
+            self.status_window.update()
+
+    def update_ui(self, loop, user_data=None):
+        self.status_window.update()
+        self.service_window.original_widget.tick()
+
+        if self.__schedules[self.__service].due():
+            self.refresh()
+
+        window = self.service_window.original_widget
+        metrics_job = window.metrics_job()
+
+        if metrics_job:
+            self.__engine.submit((window, 'metrics'), metrics_job, window.apply_metrics)
+
+        self.__prefetch()
+
+        if self.__event_queue_url and time.time() >= self.__events_retry:
+            windows = dict(self.__windows)
+            self.__engine.submit('events', lambda: self.__receive_events(windows), self.__apply_events)
+
+        if self.__metrics_file and time.time() - self.__metrics_written >= self.METRICS_FILE_INTERVAL:
+            self.__write_metrics()
+
+        self.__loop.set_alarm_in(1, self.update_ui)
+
+    def __prefetch(self):
+        # Hidden services are refreshed at a slower rate, so switching to them shows recent data at
+        # once. They only get a worker while the shown service is not being fetched, one at a time.
+        visible = self.service_window.original_widget
+
+        if self.__engine.is_pending(visible):
+            return
+
+        hidden = [service for service in self.__services if service != self.__service]
+
+        if any(self.__engine.is_pending(self.__windows.get(service)) for service in hidden):
+            return
+
+        for service in hidden:
+            if self.__schedules[service].due(background=True):
+                self.refresh(service)
+                return
+
+    def __receive_events(self, windows):
+        # runs on a worker thread, waits for events and looks up the resources they are about
+        if self.__event_queue is None:
+            self.__event_queue = events.EventQueue(self.__event_queue_url, self.__event_endpoint_url)
+
+        changes = {}
+
+        for service, ids in self.__event_queue.receive().items():
+            window = windows.get(service)
+
+            # services that were not shown yet get everything with their first listing
+            if window is None:
+                continue
+
+            try:
+                changes[service] = (window, window.resolve_events(ids))
+            except aws.aws_errors():
+                # the next listing of the service reconciles what these events changed
+                continue
+
+        return changes
+
+    def __apply_events(self, future):
+        try:
+            changes = future.result()
+        except aws.aws_errors():
+            # the listings keep reconciling until the queue can be read again
+            self.__events_retry = time.time() + self.EVENTS_RETRY_INTERVAL
+            return
+
+        for service, (window, (resources, removed)) in changes.items():
+            # windows of a region that is no longer shown are dropped
+            if self.__windows.get(service) is window:
+                window.apply_changes(resources, removed)
+
+    def __write_metrics(self):
+        self.__metrics_written = time.time()
+
+        try:
+            instrumentation.stats.write_prometheus(self.__metrics_file)
+        except OSError:
+            # a missing directory must not take the UI down, the file is simply not updated
+            pass
+
+    def run(self):
+        self.__loop.set_alarm_in(0, self.__start)
+
+        try:
+            self.__loop.run()
+        finally:
+            self.__engine.shutdown()
+
+            if self.__credential_refresher:
+                self.__credential_refresher.stop()
+
+            if self.__cache:
+                self.__cache.close()
+
+            if self.__metrics_file:
+                self.__write_metrics()
@@ -1,103 +1,598 @@
 #!/usr/bin/env python3
-import datetime
+import collections
+import concurrent.futures
 import datetime as dt
+import os
+import queue
+import sys
+import threading
+import time
+
+from aws_top.cache import TtlCache
+from aws_top import recording
+from aws_top.instrumentation import stats
+from aws_top.ratelimit import limiter
+
+
+class ClientRegistry:
+    def __init__(self, max_pool_connections=10):
+        self.__lock = threading.Lock()
+        self.__clients = {}
+        self.__max_pool_connections = max_pool_connections
+
+    @property
+    def max_pool_connections(self):
+        return self.__max_pool_connections
+
+    @max_pool_connections.setter
+    def max_pool_connections(self, value):
+        if value != self.__max_pool_connections:
+            self.__max_pool_connections = value
+            self.clear()
+
+    def client(self, service, region=None, account=None, endpoint_url=None, session=None):
+        # session is given for an account that is not set yet, see accounts.from_profile
+        return self.__get('client', service, region, account, endpoint_url, session)
+
+    def resource(self, service, region=None, account=None):
+        return self.__get('resource', service, region, account)
+
+    def clear(self):
+        with self.__lock:
+            self.__clients.clear()
+
+    def __get(self, kind, service, region, account, endpoint_url=None, session=None):
+        # boto3 sessions are not thread-safe, so clients are only created under the lock
+        with self.__lock:
+            if session is None:
+                session = _accounts[account].session if account else _default_session()
+
+            region = region or get_region()
+            key = (kind, service, region, account or _credentials_key, endpoint_url)
+
+            if key not in self.__clients:
+                import botocore.config
+
+                factory = session.client if kind == 'client' else session.resource
+                self.__clients[key] = factory(
+                    service,
+                    region_name=region,
+                    endpoint_url=endpoint_url,
+                    config=botocore.config.Config(max_pool_connections=self.__max_pool_connections)
+                )
+                client = self.__clients[key] if kind == 'client' else self.__clients[key].meta.client
+                stats.instrument(client)
+                limiter.attach(client)
+                recording.attach(client, region, account)
+
+            return self.__clients[key]
+
+
+# used until the regions enabled for the account are known, see discover_regions
+REGIONS = [
+    "us-east-1",
+    "us-east-2",
+    "us-west-1",
+    "us-west-2",
+    "ca-central-1",
+    "eu-west-1",
+    "eu-central-1",
+    "eu-west-2",
+    "eu-west-3",
+    "ap-northeast-1",
+    "ap-northeast-2",
+    "ap-southeast-1",
+    "ap-southeast-2",
+    "ap-south-1",
+    "sa-east-1",
+    "us-gov-west-1",
+]
+
+clients = ClientRegistry()
+_session_lock = threading.Lock()
+_session_args = {}
+_session_outdated = False
+_warmed_up = False
+_credentials_key = None
+_all_regions = False
+_accounts = collections.OrderedDict()
+# AWS account id of the default credentials, known once the caller identity was looked up
+_default_account_id = None
+_region = None
+_available_regions = None
+_selected_regions = [region for region in REGIONS if not region.startswith('us-gov-')]
+_regions_given = False
+region_concurrency = 4
+# regions enabled for an account rarely change
+REGIONS_MAX_AGE = 24 * 60 * 60
+
+
+def aws_errors():
+    # botocore is imported lazily, so the exception types are looked up when they are needed
+    import botocore.exceptions
+
+    return botocore.exceptions.ClientError, botocore.exceptions.BotoCoreError
+
+
+def _default_session():
+    # boto3 is only imported and the default session only rebuilt when AWS is first accessed
+    global _session_outdated
+
+    import boto3
+
+    with _session_lock:
+        if _session_outdated:
+            boto3.setup_default_session(**_session_args)
+            _session_outdated = False
+
+        return boto3._get_default_session()
+
 
-import boto3
+def _update_session(**kwargs):
+    global _session_outdated
+
+    with _session_lock:
+        _session_args.update(kwargs)
+        _session_outdated = True
+
+    clients.clear()
+
+
+def warm_up():
+    # imports the SDK and resolves the default session, meant to run off the UI thread at startup
+    global _warmed_up
+
+    region = _default_session().region_name
+    _warmed_up = True
+
+    return region
+
+
+def get_known_region():
+    # like get_region, but returns None instead of loading the SDK during startup
+    if _region or _warmed_up:
+        return get_region()
+
+    return None
 
 
 def get_user():
-    return boto3.client('sts').get_caller_identity()["Arn"]
+    global _default_account_id
+
+    identity = clients.client('sts').get_caller_identity()
+    _default_account_id = identity['Account']
+
+    return identity["Arn"]
+
+
+def get_default_account_id():
+    return _default_account_id
 
 
 def get_region():
-    return boto3._get_default_session().region_name
+    return _region or _default_session().region_name
 
 
 def set_region(region):
-    boto3.setup_default_session(region_name=region)
+    # Clients are created per region, so the session stays as it is and clients of regions
+    # shown before are reused. Refreshes that are running keep the region they started with.
+    global _all_regions, _region
+
+    _all_regions = False
+    _region = region
+
+
+def get_available_regions():
+    regions = list(_available_regions or REGIONS)
+    region = get_known_region()
+
+    if region and region not in regions:
+        regions.append(region)
+
+    return regions
+
+
+def set_available_regions(regions):
+    global _available_regions, _selected_regions
+
+    _available_regions = list(regions)
+
+    # all regions mode queries the enabled regions unless --regions was given
+    if not _regions_given:
+        _selected_regions = list(regions)
+
+
+def discover_regions(cache=None, max_age=REGIONS_MAX_AGE):
+    # Regions enabled for the account, kept in the snapshot cache so that the region selector
+    # does not wait for describe_regions. Runs on a worker thread.
+    account = (get_accounts() or [None])[0]
+    key = (account or get_identity_key(), '', 'regions')
+    cached = cache.load(*key) if cache is not None else None
+
+    if cached and time.time() - cached[0] < max_age:
+        regions = cached[1]
+    else:
+        response = clients.client('ec2', account=account).describe_regions()
+        regions = sorted(region['RegionName'] for region in response['Regions'])
+
+        if cache is not None:
+            cache.save(*(key + (regions,)))
+
+    set_available_regions(regions)
+
+    return regions
+
+
+def get_identity_key():
+    # identifies the default credentials without an API call, e.g. to key cached data
+    if _credentials_key:
+        return 'key:{}'.format(_credentials_key[0])
+
+    return 'profile:{}'.format(
+        os.environ.get('AWS_PROFILE') or os.environ.get('AWS_DEFAULT_PROFILE') or 'default'
+    )
+
+
+def set_all_regions(enabled=True):
+    global _all_regions
+    _all_regions = enabled
+
+
+def is_all_regions():
+    return _all_regions
+
+
+def set_selected_regions(regions):
+    global _selected_regions, _regions_given
+    _selected_regions = list(regions)
+    _regions_given = True
+
+
+def get_target_regions():
+    return list(_selected_regions) if _all_regions else [get_region()]
+
+
+def set_accounts(accounts):
+    # accounts are objects with a name, a boto3 session and an account id, see aws_top.accounts
+    _accounts.clear()
+    _accounts.update((account.name, account) for account in accounts)
+    clients.clear()
+
+
+def get_accounts():
+    return list(_accounts)
+
+
+def get_account_name(account_id):
+    # name of the shown account with this AWS account id, None if it is not shown
+    for account in _accounts.values():
+        if account.account_id == account_id:
+            return account.name
+
+    return None
+
+
+class Target(collections.namedtuple('Target', ['account', 'region'])):
+    # an (account, region) pair resources are fetched from, account is None for the default credentials
+
+    def __str__(self):
+        return '{}/{}'.format(self.account, self.region) if self.account else self.region
+
+
+def get_targets():
+    return [
+        Target(account, region)
+        for account in get_accounts() or [None]
+        for region in get_target_regions()
+    ]
+
+
+def get_account_targets():
+    # one target per account for global services
+    return [Target(account, None) for account in get_accounts() or [None]]
 
 
 def set_credentials(aws_access_key_id=None, aws_secret_access_key=None, aws_session_token=None):
-    boto3.setup_default_session(
+    global _credentials_key
+
+    _credentials_key = (aws_access_key_id, aws_session_token)
+    _update_session(
         aws_access_key_id=aws_access_key_id,
         aws_secret_access_key=aws_secret_access_key,
         aws_session_token=aws_session_token
     )
 
 
-class CloudWatch:
-    def __init__(self, region):
-        self.__cw_client = boto3.client('cloudwatch', region_name=region)
-
-    def __get_metric_statistics(self, namespace, instance_id, metric_name):
-        return self.__cw_client.get_metric_statistics(
-            Namespace=namespace,
-            MetricName=metric_name,
-            StartTime=dt.datetime.utcnow() - dt.timedelta(minutes=20),
-            EndTime=dt.datetime.utcnow(),
-            Period=60,
-            Statistics=['Average'],
-            Dimensions=[
-                {
-                    'Name': 'InstanceId',
-                    'Value': instance_id
-                }
-            ]
-        )['Datapoints']
+def configure(access_key=None, secret_key=None, session_token=None, region=None, max_pool_connections=None,
+              regions=None, all_regions=False, concurrency=None):
+    global region_concurrency
 
-    def get_cpu_utilization(self, instance_id):
-        return self.__get_metric_statistics(
-            'AWS/EC2',
-            instance_id,
-            'CPUUtilization'
-        )
+    if max_pool_connections:
+        clients.max_pool_connections = max_pool_connections
 
-    def get_status_check_status(self, instance_id):
-        return self.__get_metric_statistics(
-            'AWS/EC2',
-            instance_id,
-            'StatusCheckFailed'
-        )
+    if access_key and secret_key or session_token:
+        set_credentials(access_key, secret_key, session_token)
 
-    def get_disk_bytes_read(self, instance_id):
-        return self.__get_metric_statistics(
-            'AWS/EC2',
-            instance_id,
-            'DiskReadBytes'
-        )
+    if region:
+        set_region(region)
 
-    def get_disk_bytes_write(self, instance_id):
-        return self.__get_metric_statistics(
-            'AWS/EC2',
-            instance_id,
-            'DiskWriteBytes'
-        )
+    if regions:
+        set_selected_regions(regions)
 
-    def get_network_bytes_in(self, instance_id):
-        return self.__get_metric_statistics(
-            'AWS/EC2',
-            instance_id,
-            'NetworkIn'
-        )
+    if concurrency:
+        region_concurrency = concurrency
+
+    set_all_regions(all_regions)
+
+
+class TargetComplete(collections.namedtuple('TargetComplete', ['target'])):
+    pass
+
+
+class PartialFailure(collections.namedtuple('PartialFailure', ['target', 'error'])):
+    def __str__(self):
+        return '{}: {}'.format(self.target, self.error)
+
+
+def fan_out(targets, fetch_pages, max_workers=None):
+    # Runs fetch_pages(target) for all targets concurrently and yields their pages in the order
+    # they arrive, followed by a TargetComplete marker per target. A failing target yields a
+    # PartialFailure instead of stopping the others.
+    if len(targets) == 1:
+        for page in fetch_pages(targets[0]):
+            yield page
+        return
+
+    results = queue.Queue()
+    done = object()
+    # set when the consumer stops early, e.g. a refresh of a region that is no longer shown
+    stopped = threading.Event()
+
+    def run(target):
+        try:
+            for page in fetch_pages(target):
+                if stopped.is_set():
+                    return
+                results.put(page)
+            results.put(TargetComplete(target))
+        except aws_errors() as ex:
+            results.put(PartialFailure(target, ex))
+        finally:
+            results.put(done)
+
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers or region_concurrency)
+
+    try:
+        for target in targets:
+            executor.submit(limiter.inherit(run), target)
+
+        remaining = len(targets)
+
+        while remaining:
+            page = results.get()
+
+            if page is done:
+                remaining -= 1
+            else:
+                yield page
+    finally:
+        stopped.set()
+        executor.shutdown(wait=False)
+
+
+class MetricsFetcher:
+    # Batches GetMetricData queries for many resources and only asks for datapoints newer
+    # than the last one seen for each (resource, metric).
+    MAX_QUERIES = 500
+
+    def __init__(self, namespace, dimension, region=None, period=60, lookback=dt.timedelta(minutes=20),
+                 account=None):
+        self.__cw_client = clients.client('cloudwatch', region, account)
+        self.__namespace = namespace
+        # a tuple of dimensions, e.g. the bucket and storage type of S3 metrics, takes tuples of values as ids
+        self.__dimension = dimension
+        self.__period = period
+        self.__lookback = lookback
+        self.__last_seen = {}
+
+    def fetch(self, resource_ids, metrics):
+        # metrics maps metric names to statistics, e.g. {'CPUUtilization': 'Average'}
+        now = dt.datetime.now(dt.timezone.utc)
+        wanted = set(resource_ids)
+        self.__last_seen = {key: value for key, value in self.__last_seen.items() if key[0] in wanted}
+
+        queries = [
+            (self.__start_time(resource_id, metric, now), resource_id, metric, stat)
+            for resource_id in resource_ids
+            for metric, stat in metrics.items()
+        ]
+        # queries with similar start times end up in the same request
+        queries.sort(key=lambda query: query[0])
+
+        datapoints = {}
+
+        for offset in range(0, len(queries), self.MAX_QUERIES):
+            batch = queries[offset:offset + self.MAX_QUERIES]
+            datapoints.update(self.__fetch_batch(batch, now))
+
+        return datapoints
+
+    def __start_time(self, resource_id, metric, now):
+        last_seen = self.__last_seen.get((resource_id, metric))
+
+        if last_seen is None:
+            return now - self.__lookback
+
+        return last_seen + dt.timedelta(seconds=1)
+
+    def __fetch_batch(self, batch, now):
+        by_id = {}
+        metric_queries = []
+
+        for i, (start_time, resource_id, metric, stat) in enumerate(batch):
+            query_id = 'm{}'.format(i)
+            by_id[query_id] = (resource_id, metric)
+            metric_queries.append({
+                'Id': query_id,
+                'MetricStat': {
+                    'Metric': {
+                        'Namespace': self.__namespace,
+                        'MetricName': metric,
+                        'Dimensions': self.__dimensions(resource_id)
+                    },
+                    'Period': self.__period,
+                    'Stat': stat
+                },
+                'ReturnData': True
+            })
+
+        datapoints = {}
+        paginator = self.__cw_client.get_paginator('get_metric_data')
+
+        for page in paginator.paginate(MetricDataQueries=metric_queries, StartTime=batch[0][0], EndTime=now):
+            for result in page['MetricDataResults']:
+                key = by_id[result['Id']]
+                last_seen = self.__last_seen.get(key)
+                points = [
+                    (timestamp, value)
+                    for timestamp, value in zip(result['Timestamps'], result['Values'])
+                    if last_seen is None or timestamp > last_seen
+                ]
+                datapoints.setdefault(key, []).extend(points)
 
-    def get_network_bytes_out(self, instance_id):
-        return self.__get_metric_statistics(
-            'AWS/EC2',
-            instance_id,
-            'NetworkOut'
+        for key, points in datapoints.items():
+            points.sort()
+
+            if points:
+                self.__last_seen[key] = points[-1][0]
+
+        return datapoints
+
+    def __dimensions(self, resource_id):
+        if isinstance(self.__dimension, tuple):
+            return [{'Name': name, 'Value': value} for name, value in zip(self.__dimension, resource_id)]
+
+        return [{'Name': self.__dimension, 'Value': resource_id}]
+
+
+class Resource:
+    # Resources use __slots__ and intern the values shared by many of them, e.g. states and instance
+    # types, so that 100k of them stay small. Fields keep the type returned by the API and are only
+    # formatted when a row is rendered.
+    __slots__ = ()
+    FIELDS = ()
+    region = None
+    account = None
+
+    @property
+    def key(self):
+        raise NotImplementedError
+
+    @property
+    def metric_id(self):
+        # value of the CloudWatch dimension identifying this resource
+        raise NotImplementedError
+
+    @property
+    def target(self):
+        return Target(self.account, self.region)
+
+    def values(self):
+        return tuple(getattr(self, field) for field in self.FIELDS)
+
+    def as_dict(self):
+        record = collections.OrderedDict([('account', self.account), ('region', self.region)])
+        record.update(zip(self.FIELDS, self.values()))
+
+        return record
+
+
+class SnapshotDiff(collections.namedtuple('SnapshotDiff', ['added', 'removed', 'changed'])):
+    # added and removed map keys to resources, changed maps keys to (old, new, changed field names)
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.changed)
+
+
+def diff_snapshots(old, new):
+    added = {}
+    changed = {}
+
+    for key, resource in new.items():
+        previous = old.get(key)
+
+        if previous is None:
+            added[key] = resource
+        elif previous.values() != resource.values():
+            fields = frozenset(
+                field for field, before, after in zip(resource.FIELDS, previous.values(), resource.values())
+                if before != after
+            )
+            changed[key] = (previous, resource, fields)
+
+    removed = {key: resource for key, resource in old.items() if key not in new}
+
+    return SnapshotDiff(added, removed, changed)
+
+
+class SnapshotDiffer:
+    def __init__(self):
+        self.snapshot = {}
+
+    def update(self, resources):
+        snapshot = collections.OrderedDict((resource.key, resource) for resource in resources)
+        diff = diff_snapshots(self.snapshot, snapshot)
+        self.snapshot = snapshot
+
+        return diff
+
+    def apply(self, resources, removed=()):
+        # diff of a few resources that changed or were added and keys that were removed, without
+        # comparing the whole snapshot
+        diff = diff_snapshots(
+            {resource.key: self.snapshot[resource.key] for resource in resources if resource.key in self.snapshot},
+            {resource.key: resource for resource in resources}
         )
 
+        for key in removed:
+            resource = self.snapshot.pop(key, None)
+
+            if resource is not None:
+                diff.removed[key] = resource
 
-class Ec2Instance:
-    def __init__(self, identifier, state, instance_type, az, name=None):
+        for resource in resources:
+            self.snapshot[resource.key] = resource
+
+        return diff
+
+
+def watch_diffs(fetch, interval):
+    differ = SnapshotDiffer()
+
+    while True:
+        diff = differ.update(fetch())
+
+        if diff:
+            yield diff
+
+        time.sleep(interval)
+
+
+class Ec2Instance(Resource):
+    __slots__ = ('id', 'state', 'instance_type', 'az', 'name', 'region', 'account')
+    FIELDS = ('id', 'name', 'state', 'instance_type', 'az')
+
+    def __init__(self, identifier, state, instance_type, az, name=None, region=None, account=None):
         self.id = identifier
         self.state = state
         self.instance_type = instance_type
         self.az = az
         self.name = name
+        self.region = region
+        self.account = account
 
     @staticmethod
-    def from_dict(dict_content):
+    def from_dict(dict_content, region=None, account=None):
         name = None
 
         if 'Tags' in dict_content:
@@ -107,72 +602,378 @@ class Ec2Instance:
 
         return Ec2Instance(
             dict_content['InstanceId'],
-            dict_content['State']['Name'],
-            dict_content['InstanceType'],
-            dict_content['Placement']['AvailabilityZone'],
-            name
+            sys.intern(dict_content['State']['Name']),
+            sys.intern(dict_content['InstanceType']),
+            sys.intern(dict_content['Placement']['AvailabilityZone']),
+            name,
+            region,
+            account
         )
 
+    @property
+    def key(self):
+        return self.account, self.region, self.id
+
+    @property
+    def metric_id(self):
+        return self.id
+
 
 class Ec2:
-    def __init__(self):
-        self.__ec2_client = boto3.client('ec2')
+    # filter bar prefixes and the DescribeInstances filters they are sent as
+    FILTERS = {
+        'id': 'instance-id',
+        'state': 'instance-state-name',
+        'type': 'instance-type',
+        'az': 'availability-zone',
+        'tag': None
+    }
+
+    def __init__(self, region=None, account=None, filters=None):
+        self.region = region or get_region()
+        self.account = account
+        self.filters = filters or []
+        self.__ec2_client = clients.client('ec2', self.region, account)
+
+    @classmethod
+    def build_filters(cls, query_filters):
+        # {'state': ['running'], 'tag': ['team=web', 'owner']} -> Filters parameter of DescribeInstances
+        filters = []
+
+        for prefix, values in query_filters.items():
+            if prefix != 'tag':
+                filters.append({'Name': cls.FILTERS[prefix], 'Values': list(values)})
+                continue
+
+            for value in values:
+                key, separator, tag_value = value.partition('=')
+
+                if separator:
+                    filters.append({'Name': 'tag:{}'.format(key), 'Values': [tag_value]})
+                else:
+                    filters.append({'Name': 'tag-key', 'Values': [key]})
+
+        return filters
+
+    def iter_instance_pages(self):
+        paginator = self.__ec2_client.get_paginator('describe_instances')
+
+        for page in paginator.paginate(**({'Filters': self.filters} if self.filters else {})):
+            yield [
+                Ec2Instance.from_dict(instance, self.region, self.account)
+                for reservation in page['Reservations']
+                for instance in reservation['Instances']
+            ]
 
     def get_all_instances(self):
-        instances = []
+        return [instance for page in self.iter_instance_pages() for instance in page]
 
-        for instance in self.__ec2_client.describe_instances()['Reservations']:
-            instances.append(
-                Ec2Instance.from_dict(
-                    instance['Instances'][0]
-                )
-            )
+    def get_instances(self, instance_ids):
+        # the instances of instance_ids that still match the filters, unknown ids are no error
+        filters = self.filters + [{'Name': 'instance-id', 'Values': list(instance_ids)}]
+        paginator = self.__ec2_client.get_paginator('describe_instances')
 
-        return instances
+        return [
+            Ec2Instance.from_dict(instance, self.region, self.account)
+            for page in paginator.paginate(Filters=filters)
+            for reservation in page['Reservations']
+            for instance in reservation['Instances']
+        ]
 
 
-class S3:
-    def __init__(self):
-        self.__s3_client = boto3.resource('s3')
+class S3Bucket(Resource):
+    __slots__ = ('name', 'creation_date', 'location', 'account')
+    FIELDS = ('name', 'location', 'creation_date')
+
+    def __init__(self, name, creation_date, location=None, account=None):
+        self.name = name
+        self.creation_date = creation_date
+        # region of the bucket, the region of the resource is None since S3 is listed per account
+        self.location = location
+        self.account = account
+
+    @staticmethod
+    def from_dict(dict_content, account=None):
+        # recent versions of the API return the region with the bucket
+        region = dict_content.get('BucketRegion')
+
+        return S3Bucket(
+            dict_content['Name'],
+            dict_content['CreationDate'],
+            sys.intern(region) if region else None,
+            account
+        )
+
+    @property
+    def key(self):
+        return self.name
+
+    @property
+    def metric_id(self):
+        return self.name
 
-    def get_all_buckets(self):
-        buckets = list(self.__s3_client.buckets.all())
+
+class S3:
+    # the region of a bucket never changes, sizes and object counts are published once a day
+    _locations = TtlCache(24 * 60 * 60)
+    _metrics = TtlCache(6 * 60 * 60)
+    # sizes are published per storage type, object counts only for all of them
+    ALL_STORAGE_TYPES = 'AllStorageTypes'
+    # legacy location constraints, us-east-1 has none
+    LOCATIONS = {
+        None: 'us-east-1',
+        '': 'us-east-1',
+        'EU': 'eu-west-1'
+    }
+
+    def __init__(self, account=None):
+        self.account = account
+        self.__s3_client = clients.client('s3', account=account)
+
+    def get_all_buckets(self, max_workers=16):
+        buckets = [S3Bucket.from_dict(bucket, self.account) for bucket in self.__s3_client.list_buckets()['Buckets']]
+        self.__resolve_locations([bucket for bucket in buckets if bucket.location is None], max_workers)
 
         return buckets
 
+    def get_bucket_location(self, name):
+        constraint = self.__s3_client.get_bucket_location(Bucket=name).get('LocationConstraint')
+        return sys.intern(self.LOCATIONS.get(constraint, constraint))
+
+    def __resolve_locations(self, buckets, max_workers):
+        missing = set(self._locations.missing([(self.account, bucket.name) for bucket in buckets]))
+
+        def lookup(name):
+            try:
+                return self.get_bucket_location(name)
+            except aws_errors():
+                # e.g. no permission, the bucket is shown without region and size
+                return None
+
+        if missing:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=min(max_workers, len(missing))) as executor:
+                names = [name for account, name in missing]
+
+                for name, location in zip(names, executor.map(limiter.inherit(lookup), names)):
+                    self._locations.set((self.account, name), location)
+
+        for bucket in buckets:
+            bucket.location = self._locations.get((self.account, bucket.name))
+
+    @classmethod
+    def get_bucket_metrics(cls, buckets):
+        # {(bucket key, metric): [(timestamp, value)]} of the daily storage metrics, which CloudWatch
+        # keeps in the region of each bucket
+        groups = {}
+
+        for bucket in buckets:
+            if bucket.location and cls._metrics.get((bucket.account, bucket.name)) is None:
+                groups.setdefault((bucket.account, bucket.location), []).append(bucket.name)
+
+        for (account, location), names in groups.items():
+            fetcher = MetricsFetcher(
+                'AWS/S3', ('BucketName', 'StorageType'), location, period=24 * 60 * 60,
+                lookback=dt.timedelta(days=3), account=account
+            )
+            storage_types = cls.__get_storage_types(account, location, set(names))
+            sizes = fetcher.fetch(
+                [(name, storage_type) for name in names for storage_type in storage_types.get(name, ())],
+                {'BucketSizeBytes': 'Average'}
+            )
+            objects = fetcher.fetch([(name, cls.ALL_STORAGE_TYPES) for name in names], {'NumberOfObjects': 'Average'})
+
+            for name in names:
+                cls._metrics.set((account, name), {
+                    'BucketSizeBytes': _sum_series(
+                        sizes.get(((name, storage_type), 'BucketSizeBytes'), [])
+                        for storage_type in storage_types.get(name, ())
+                    ),
+                    'NumberOfObjects': objects.get(((name, cls.ALL_STORAGE_TYPES), 'NumberOfObjects'), [])
+                })
+
+        return {
+            (bucket.key, metric): points
+            for bucket in buckets
+            for metric, points in (cls._metrics.get((bucket.account, bucket.name)) or {}).items()
+        }
+
+    @staticmethod
+    def __get_storage_types(account, location, names):
+        # {bucket name: storage types with a size}, e.g. StandardStorage and GlacierStorage, which
+        # together make up the size of a bucket
+        storage_types = {}
+        paginator = clients.client('cloudwatch', location, account).get_paginator('list_metrics')
+
+        for page in paginator.paginate(Namespace='AWS/S3', MetricName='BucketSizeBytes'):
+            for metric in page['Metrics']:
+                dimensions = {dimension['Name']: dimension['Value'] for dimension in metric['Dimensions']}
+
+                if dimensions.get('BucketName') in names and 'StorageType' in dimensions:
+                    storage_types.setdefault(dimensions['BucketName'], []).append(dimensions['StorageType'])
+
+        return storage_types
+
+
+def _sum_series(series):
+    # [(timestamp, value)] summed per timestamp
+    totals = {}
+
+    for points in series:
+        for timestamp, value in points:
+            totals[timestamp] = totals.get(timestamp, 0) + value
 
-class LambdaFunction:
-    def __init__(self, name, runtime, code_size, memory_size, timeout, last_modified):
+    return sorted(totals.items())
+
+
+class LambdaFunction(Resource):
+    __slots__ = ('name', 'runtime', 'code_size', 'memory_size', 'timeout', 'last_modified', 'region', 'account')
+    FIELDS = ('name', 'runtime', 'code_size', 'memory_size', 'timeout', 'last_modified')
+
+    def __init__(self, name, runtime, code_size, memory_size, timeout, last_modified, region=None, account=None):
         self.name = name
         self.runtime = runtime
         self.code_size = code_size
         self.memory_size = memory_size
         self.timeout = timeout
         self.last_modified = last_modified
+        self.region = region
+        self.account = account
 
     @staticmethod
-    def from_dict(dict_content):
-        last_modified = dict_content['LastModified']
-        last_modified = datetime.datetime.strptime(
-            last_modified,
-            '%Y-%m-%dT%H:%M:%S.%f%z'
-        )
+    def from_dict(dict_content, region=None, account=None):
+        # functions deployed as container images have no runtime
+        runtime = dict_content.get('Runtime')
 
+        # LastModified stays an ISO 8601 string like 2018-01-01T00:00:00.000+0000, which also sorts by time
         return LambdaFunction(
             dict_content['FunctionName'],
-            dict_content['Runtime'],
-            str(dict_content['CodeSize']),
-            str(dict_content['MemorySize']),
-            str(dict_content['Timeout']),
-            last_modified.strftime("%Y-%m-%d %H:%M:%S")
+            sys.intern(runtime) if runtime else None,
+            dict_content['CodeSize'],
+            dict_content['MemorySize'],
+            dict_content['Timeout'],
+            dict_content['LastModified'],
+            region,
+            account
         )
 
+    @property
+    def key(self):
+        return self.account, self.region, self.name
+
+    @property
+    def metric_id(self):
+        return self.name
+
 
 class Lambda:
-    def __init__(self):
-        self.__lambda_client = boto3.client('lambda')
+    def __init__(self, region=None, account=None):
+        self.region = region or get_region()
+        self.account = account
+        self.__lambda_client = clients.client('lambda', self.region, account)
+
+    def iter_function_pages(self):
+        for page in self.__lambda_client.get_paginator('list_functions').paginate():
+            yield [LambdaFunction.from_dict(func, self.region, self.account) for func in page['Functions']]
 
     def get_all_functions(self):
-        return [
-            LambdaFunction.from_dict(func) for func in self.__lambda_client.list_functions()['Functions']
-        ]
+        return [func for page in self.iter_function_pages() for func in page]
+
+    def get_function(self, name):
+        # None if the function does not exist (anymore)
+        try:
+            response = self.__lambda_client.get_function_configuration(FunctionName=name)
+        except aws_errors() as ex:
+            if getattr(ex, 'response', {}).get('Error', {}).get('Code') == 'ResourceNotFoundException':
+                return None
+            raise
+
+        return LambdaFunction.from_dict(response, self.region, self.account)
+
+
+class DynamoDbTable(Resource):
+    __slots__ = (
+        'name', 'status', 'item_count', 'size', 'billing_mode', 'read_capacity', 'write_capacity',
+        'region', 'account'
+    )
+    FIELDS = ('name', 'status', 'item_count', 'size', 'billing_mode', 'read_capacity', 'write_capacity')
+
+    def __init__(self, name, status, item_count, size, billing_mode, read_capacity, write_capacity,
+                 region=None, account=None):
+        self.name = name
+        self.status = status
+        self.item_count = item_count
+        self.size = size
+        self.billing_mode = billing_mode
+        self.read_capacity = read_capacity
+        self.write_capacity = write_capacity
+        self.region = region
+        self.account = account
+
+    @staticmethod
+    def from_dict(dict_content, region=None, account=None):
+        # tables created before on-demand capacity existed have no billing mode summary
+        billing_mode = dict_content.get('BillingModeSummary', {}).get('BillingMode', 'PROVISIONED')
+        throughput = dict_content.get('ProvisionedThroughput', {})
+
+        # on-demand tables report a provisioned throughput of 0
+        return DynamoDbTable(
+            dict_content['TableName'],
+            sys.intern(dict_content['TableStatus']),
+            dict_content.get('ItemCount'),
+            dict_content.get('TableSizeBytes'),
+            sys.intern(billing_mode),
+            throughput.get('ReadCapacityUnits') or None,
+            throughput.get('WriteCapacityUnits') or None,
+            region,
+            account
+        )
+
+    @property
+    def key(self):
+        return self.account, self.region, self.name
+
+    @property
+    def metric_id(self):
+        return self.name
+
+
+class DynamoDb:
+    # list_tables only returns names, so every table has to be described. Descriptions are made
+    # concurrently and kept for a while, since item counts and sizes are only updated by AWS about
+    # every six hours. Tables that are being created, updated or deleted are described every time.
+    _tables = TtlCache(10 * 60)
+
+    def __init__(self, region=None, account=None):
+        self.region = region or get_region()
+        self.account = account
+        self.__dynamodb_client = clients.client('dynamodb', self.region, account)
+
+    def iter_table_pages(self, max_workers=8):
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+
+        try:
+            for page in self.__dynamodb_client.get_paginator('list_tables').paginate():
+                names = page['TableNames']
+                cached = {name: self._tables.get((self.account, self.region, name)) for name in names}
+                missing = [name for name in names if cached[name] is None]
+
+                for name, table in zip(missing, executor.map(limiter.inherit(self.describe_table), missing)):
+                    cached[name] = table
+
+                    if table is not None and table.status == 'ACTIVE':
+                        self._tables.set((self.account, self.region, name), table)
+
+                yield [cached[name] for name in names if cached[name] is not None]
+        finally:
+            executor.shutdown(wait=False)
+
+    def describe_table(self, name):
+        try:
+            response = self.__dynamodb_client.describe_table(TableName=name)
+        except aws_errors() as ex:
+            # deleted since it was listed
+            if getattr(ex, 'response', {}).get('Error', {}).get('Code') == 'ResourceNotFoundException':
+                return None
+            raise
+
+        return DynamoDbTable.from_dict(response['Table'], self.region, self.account)
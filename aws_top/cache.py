@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+import hashlib
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import zlib
+
+DEFAULT_PATH = os.path.join(
+    os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'),
+    'aws-top',
+    'snapshots.db'
+)
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+DEFAULT_MAX_AGE = 7 * 24 * 60 * 60
+# raise whenever a cached resource changes, e.g. gains a slot, so older snapshots are dropped
+# instead of failing once they are rendered
+FORMAT_VERSION = 1
+
+
+class SnapshotCache:
+    # Last listing per (account, region, service), pickled and compressed in a SQLite file. The oldest
+    # snapshots are evicted once they exceed max_age seconds or the file grows beyond max_size bytes.
+
+    def __init__(self, path=DEFAULT_PATH, max_size=DEFAULT_MAX_SIZE, max_age=DEFAULT_MAX_AGE):
+        self.max_size = max_size
+        self.max_age = max_age
+        self.__lock = threading.Lock()
+        self.__digests = {}
+        self.__closed = False
+        # listings handed over by save_later, pickled and written by a background thread
+        self.__pending = {}
+        self.__pending_changed = threading.Condition()
+        self.__writer = None
+
+        directory = os.path.dirname(path)
+
+        if directory:
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+
+        # writes happen on refresh worker threads, reads on the urwid loop
+        self.__db = sqlite3.connect(path, check_same_thread=False)
+
+        if self.__db.execute('PRAGMA user_version').fetchone()[0] != FORMAT_VERSION:
+            self.__db.execute('DROP TABLE IF EXISTS snapshots')
+            self.__db.execute('PRAGMA user_version = {}'.format(FORMAT_VERSION))
+
+        self.__db.execute(
+            'CREATE TABLE IF NOT EXISTS snapshots ('
+            'account TEXT, region TEXT, service TEXT, saved_at REAL, size INTEGER, data BLOB, '
+            'PRIMARY KEY (account, region, service))'
+        )
+        self.evict()
+
+    def load(self, account, region, service):
+        # returns (saved_at, items) or None
+        with self.__lock:
+            row = self.__db.execute(
+                'SELECT saved_at, data FROM snapshots WHERE account = ? AND region = ? AND service = ?',
+                (account, region, service)
+            ).fetchone()
+
+        if row is None or row[0] < time.time() - self.max_age:
+            return None
+
+        try:
+            return row[0], pickle.loads(zlib.decompress(row[1]))
+        except (zlib.error, pickle.UnpicklingError, AttributeError, EOFError, ImportError):
+            # written by an incompatible version, the next save replaces it
+            return None
+
+    def save(self, account, region, service, items):
+        data = zlib.compress(pickle.dumps(items, pickle.HIGHEST_PROTOCOL))
+        digest = hashlib.sha1(data).digest()
+        key = (account, region, service)
+
+        with self.__lock:
+            # unchanged listings are not written again
+            if self.__closed or self.__digests.get(key) == digest:
+                return
+
+            self.__db.execute(
+                'INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?, ?, ?, ?)',
+                key + (time.time(), len(data), sqlite3.Binary(data))
+            )
+            self.__db.commit()
+            self.__digests[key] = digest
+
+        self.evict()
+
+    def save_later(self, account, region, service, items):
+        # for the urwid loop, a listing that is saved again before it was written replaces the older one
+        with self.__pending_changed:
+            self.__pending[(account, region, service)] = items
+
+            if self.__writer is None:
+                self.__writer = threading.Thread(target=self.__write_pending, daemon=True)
+                self.__writer.start()
+
+            self.__pending_changed.notify()
+
+    def __write_pending(self):
+        while True:
+            with self.__pending_changed:
+                while not self.__pending:
+                    self.__pending_changed.wait()
+
+                key = next(iter(self.__pending))
+                items = self.__pending.pop(key)
+
+            self.save(*(key + (items,)))
+
+    def evict(self):
+        with self.__lock:
+            if self.__closed:
+                return
+
+            self.__db.execute('DELETE FROM snapshots WHERE saved_at < ?', (time.time() - self.max_age,))
+
+            total = self.__db.execute('SELECT COALESCE(SUM(size), 0) FROM snapshots').fetchone()[0]
+
+            if total > self.max_size:
+                rows = self.__db.execute(
+                    'SELECT account, region, service, size FROM snapshots ORDER BY saved_at'
+                ).fetchall()
+
+                for account, region, service, size in rows:
+                    if total <= self.max_size:
+                        break
+
+                    self.__db.execute(
+                        'DELETE FROM snapshots WHERE account = ? AND region = ? AND service = ?',
+                        (account, region, service)
+                    )
+                    self.__digests.pop((account, region, service), None)
+                    total -= size
+
+            self.__db.commit()
+
+    def close(self):
+        # listings that were not written yet are written before closing
+        with self.__pending_changed:
+            pending, self.__pending = self.__pending, {}
+
+        for key, items in pending.items():
+            self.save(*(key + (items,)))
+
+        with self.__lock:
+            self.__closed = True
+            self.__db.close()
+
+
+class TtlCache:
+    # In-memory values that expire ttl seconds after they were stored, for data that changes far
+    # less often than it is displayed. Shared by the refresh worker threads.
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.__lock = threading.Lock()
+        self.__values = {}
+
+    def get(self, key, default=None):
+        with self.__lock:
+            entry = self.__values.get(key)
+
+        if entry is None or entry[0] < time.time():
+            return default
+
+        return entry[1]
+
+    def set(self, key, value):
+        with self.__lock:
+            self.__values[key] = (time.time() + self.ttl, value)
+
+    def missing(self, keys):
+        # keys without a value that is still valid
+        now = time.time()
+
+        with self.__lock:
+            return [key for key in keys if key not in self.__values or self.__values[key][0] < now]
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+import configparser
+import os
+
+DEFAULT_PATH = os.path.expanduser('~/.aws-top.ini')
+
+
+def load(path=None):
+    config = configparser.ConfigParser()
+
+    if path:
+        with open(path) as config_file:
+            config.read_file(config_file)
+    else:
+        config.read(DEFAULT_PATH)
+
+    return config
+
+
+def get_intervals(config, overrides=None, defaults=None):
+    # config keys and overrides are matched case-insensitively against the default service names
+    intervals = dict(defaults or {})
+    names = {name.lower(): name for name in intervals}
+
+    values = dict(config.items('intervals')) if config.has_section('intervals') else {}
+    values.update((service.lower(), value) for service, value in (overrides or {}).items())
+
+    for service, value in values.items():
+        intervals[names.get(service.lower(), service)] = float(value)
+
+    return intervals
+
+
+def parse_interval(value):
+    service, sep, seconds = value.partition('=')
+
+    if not sep:
+        raise ValueError('expected SERVICE=SECONDS, got {}'.format(value))
+
+    return service.strip(), float(seconds)
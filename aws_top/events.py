@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+import json
+
+import aws_top.aws
+
+# services kept up to date by events, their listings only reconcile what events missed
+SERVICES = ('EC2', 'Lambda')
+RECONCILE_INTERVAL = 300
+
+# CloudTrail events of Lambda API calls that change a function
+LAMBDA_EVENTS = ('CreateFunction', 'UpdateFunctionConfiguration', 'UpdateFunctionCode', 'DeleteFunction')
+
+
+def _account(account_id):
+    # (known, account name) of the shown account with this id, the name is None for the default credentials
+    if not aws_top.aws.get_accounts():
+        default_account_id = aws_top.aws.get_default_account_id()
+
+        return default_account_id is None or default_account_id == account_id, None
+
+    name = aws_top.aws.get_account_name(account_id)
+
+    return name is not None, name
+
+
+def parse_event(event):
+    # (service, aws.Target, resource id) of an EventBridge event or None if it is of no interest,
+    # e.g. of an account that is not shown when the event bus collects those of a whole organization
+    detail = event.get('detail') or {}
+    known, account = _account(event.get('account'))
+
+    if not known:
+        return None
+
+    target = aws_top.aws.Target(account, event.get('region'))
+
+    if event.get('source') == 'aws.ec2' and detail.get('instance-id'):
+        return 'EC2', target, detail['instance-id']
+
+    if event.get('source') == 'aws.lambda' and (detail.get('eventName') or '').startswith(LAMBDA_EVENTS):
+        parameters = detail.get('requestParameters') or detail.get('responseElements') or {}
+        name = parameters.get('functionName')
+
+        if name:
+            # the function may be given by its ARN, arn:aws:lambda:region:account:function:name
+            return 'Lambda', target, name.split(':')[6] if name.startswith('arn:') else name
+
+    return None
+
+
+def parse_message(body):
+    # events are delivered by EventBridge as they are or wrapped in an SNS notification
+    try:
+        event = json.loads(body)
+
+        if event.get('Type') == 'Notification' and 'Message' in event:
+            event = json.loads(event['Message'])
+
+        return parse_event(event) if isinstance(event, dict) else None
+    except (ValueError, AttributeError, TypeError, IndexError):
+        # not shaped like the events of the rules, e.g. a test message, it must not stop the others
+        return None
+
+
+class EventQueue:
+    # SQS queue that EventBridge rules send EC2 state changes and Lambda API calls recorded by
+    # CloudTrail to. endpoint_url points to a local stand-in like ElasticMQ or moto.
+    MAX_MESSAGES = 10
+    MAX_BATCHES = 10
+
+    def __init__(self, queue_url, endpoint_url=None, wait_seconds=20):
+        self.queue_url = queue_url
+        self.wait_seconds = wait_seconds
+        self.__sqs_client = aws_top.aws.clients.client('sqs', self.__region(queue_url), endpoint_url=endpoint_url)
+
+    @staticmethod
+    def __region(queue_url):
+        # https://sqs.eu-west-1.amazonaws.com/123456789012/name
+        host = queue_url.split('/')[2] if '://' in queue_url else ''
+        parts = host.split('.')
+
+        return parts[1] if len(parts) > 3 and parts[0] == 'sqs' else None
+
+    def receive(self):
+        # Long-polls the queue and drains what is waiting, runs on a worker thread. Returns
+        # {service: {aws.Target: set of resource ids}}. Messages are deleted once read, an event
+        # that cannot be applied is picked up by the next reconciliation instead.
+        changes = {}
+        wait_seconds = self.wait_seconds
+
+        for _ in range(self.MAX_BATCHES):
+            messages = self.__sqs_client.receive_message(
+                QueueUrl=self.queue_url,
+                MaxNumberOfMessages=self.MAX_MESSAGES,
+                WaitTimeSeconds=wait_seconds
+            ).get('Messages', [])
+
+            for message in messages:
+                change = parse_message(message['Body'])
+
+                if change is not None:
+                    service, target, resource_id = change
+                    changes.setdefault(service, {}).setdefault(target, set()).add(resource_id)
+
+            if messages:
+                self.__sqs_client.delete_message_batch(
+                    QueueUrl=self.queue_url,
+                    Entries=[
+                        {'Id': str(i), 'ReceiptHandle': message['ReceiptHandle']}
+                        for i, message in enumerate(messages)
+                    ]
+                )
+
+            if len(messages) < self.MAX_MESSAGES:
+                break
+
+            wait_seconds = 0
+
+        return changes
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+import csv
+import datetime
+import json
+import os
+import sys
+import time
+
+import aws_top.aws
+import aws_top.instrumentation
+
+FORMATS = ('jsonl', 'csv')
+
+
+def _fetch_ec2(target):
+    return aws_top.aws.Ec2(target.region, target.account).iter_instance_pages()
+
+
+def _fetch_s3(target):
+    yield aws_top.aws.S3(target.account).get_all_buckets()
+
+
+def _fetch_lambda(target):
+    return aws_top.aws.Lambda(target.region, target.account).iter_function_pages()
+
+
+def _fetch_dynamodb(target):
+    return aws_top.aws.DynamoDb(target.region, target.account).iter_table_pages()
+
+
+# service -> (targets, fetch_pages), the same fetchers the windows use
+SERVICES = {
+    'ec2': (aws_top.aws.get_targets, _fetch_ec2),
+    's3': (aws_top.aws.get_account_targets, _fetch_s3),
+    'lambda': (aws_top.aws.get_targets, _fetch_lambda),
+    'dynamodb': (aws_top.aws.get_targets, _fetch_dynamodb),
+}
+
+
+def _plain(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+
+    return value
+
+
+class JsonLinesWriter:
+    def __init__(self, stream):
+        self.__stream = stream
+
+    def write(self, records):
+        for record in records:
+            self.__stream.write(json.dumps(record, default=_plain))
+            self.__stream.write('\n')
+
+        self.__stream.flush()
+
+
+class CsvWriter:
+    # the header is written once, taken from the first record
+    def __init__(self, stream):
+        self.__stream = stream
+        self.__writer = None
+
+    def write(self, records):
+        for record in records:
+            if self.__writer is None:
+                self.__writer = csv.DictWriter(self.__stream, fieldnames=list(record))
+                self.__writer.writeheader()
+
+            self.__writer.writerow({field: _plain(value) for field, value in record.items()})
+
+        self.__stream.flush()
+
+
+WRITERS = {
+    'jsonl': JsonLinesWriter,
+    'csv': CsvWriter,
+}
+
+
+def export(service, writer, errors=sys.stderr):
+    # Streams the records of every page to writer as soon as it arrives, returns the number of
+    # targets that could not be fetched.
+    targets, fetch_pages = SERVICES[service]
+    collected_at = datetime.datetime.now(datetime.timezone.utc).isoformat()
+    failures = 0
+
+    try:
+        for page in aws_top.aws.fan_out(targets(), fetch_pages):
+            if isinstance(page, aws_top.aws.TargetComplete):
+                continue
+
+            if isinstance(page, aws_top.aws.PartialFailure):
+                print(str(page), file=errors)
+                failures += 1
+                continue
+
+            records = []
+
+            for resource in page:
+                record = resource.as_dict()
+                record['collected_at'] = collected_at
+                records.append(record)
+
+            writer.write(records)
+    except aws_top.aws.aws_errors() as ex:
+        print(str(ex), file=errors)
+        failures += 1
+
+    return failures
+
+
+def run(service, output_format, watch=None, stream=sys.stdout, metrics_file=None):
+    # --once exports a single listing, --watch N repeats it every N seconds until interrupted
+    writer = WRITERS[output_format](stream)
+
+    try:
+        while True:
+            started = time.monotonic()
+            failures = export(service, writer)
+
+            if metrics_file:
+                aws_top.instrumentation.stats.write_prometheus(metrics_file)
+
+            if watch is None:
+                return 1 if failures else 0
+
+            time.sleep(max(watch - (time.monotonic() - started), 0))
+    except KeyboardInterrupt:
+        return 130
+    except BrokenPipeError:
+        # the reader went away, e.g. aws-top --once | head, nothing left to flush at exit
+        os.dup2(os.open(os.devnull, os.O_WRONLY), stream.fileno())
+        return 0
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+import collections
+import os
+import threading
+import time
+
+from aws_top.scheduler import THROTTLING_ERRORS
+
+# upper bounds in seconds, shared by API latencies and UI timings
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, float('inf'))
+
+
+class Histogram:
+    __slots__ = ('counts', 'count', 'sum', 'max')
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    @property
+    def average(self):
+        return self.sum / self.count if self.count else 0.0
+
+    def quantile(self, q):
+        # upper bound of the bucket containing the q-quantile, the largest value for the last bucket
+        rank = q * self.count
+        seen = 0
+
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+
+            if seen >= rank and count:
+                return min(bound, self.max)
+
+        return self.max
+
+
+class ApiStats:
+    __slots__ = ('calls', 'errors', 'retries', 'throttles', 'latency')
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.throttles = 0
+        self.latency = Histogram()
+
+
+class Stats:
+    # Counters of the AWS calls made by every client of aws.clients and timings of the windows.
+    # Botocore emits its events on the refresh worker threads, so all updates hold the lock.
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__api = collections.defaultdict(ApiStats)
+        self.__ui = collections.defaultdict(Histogram)
+        self.started = time.time()
+
+    def instrument(self, client):
+        events = client.meta.events
+        service = client.meta.service_model.service_name
+
+        events.register_first('before-call.*.*', self.__before_call)
+        events.register('after-call.*.*', lambda **kwargs: self.__after_call(service, **kwargs))
+        events.register('needs-retry.*.*', lambda **kwargs: self.__needs_retry(service, **kwargs))
+
+        return client
+
+    @staticmethod
+    def __before_call(context=None, **kwargs):
+        if context is not None:
+            context['aws_top_started'] = time.perf_counter()
+
+    def __after_call(self, service, model=None, parsed=None, context=None, **kwargs):
+        started = (context or {}).get('aws_top_started')
+        parsed = parsed or {}
+
+        with self.__lock:
+            stats = self.__api[(service, model.name)]
+            stats.calls += 1
+            stats.retries += parsed.get('ResponseMetadata', {}).get('RetryAttempts', 0)
+
+            if 'Error' in parsed:
+                stats.errors += 1
+
+            if started is not None:
+                stats.latency.observe(time.perf_counter() - started)
+
+    def __needs_retry(self, service, operation=None, response=None, caught_exception=None, **kwargs):
+        # emitted after every attempt, before botocore decides whether to retry
+        if response is None or operation is None:
+            return None
+
+        if response[1].get('Error', {}).get('Code') in THROTTLING_ERRORS:
+            with self.__lock:
+                self.__api[(service, operation.name)].throttles += 1
+
+        return None
+
+    def observe(self, name, seconds):
+        with self.__lock:
+            self.__ui[name].observe(seconds)
+
+    def timed(self, name):
+        return _Timer(self, name)
+
+    def api(self):
+        # [((service, operation), ApiStats)] sorted by the number of calls
+        with self.__lock:
+            return sorted(self.__api.items(), key=lambda item: -item[1].calls)
+
+    def ui(self):
+        with self.__lock:
+            return sorted(self.__ui.items())
+
+    def totals(self):
+        with self.__lock:
+            return (
+                sum(stats.calls for stats in self.__api.values()),
+                sum(stats.throttles for stats in self.__api.values())
+            )
+
+    def prometheus(self):
+        lines = []
+
+        def counter(name, help_text, attribute):
+            lines.append('# HELP {} {}'.format(name, help_text))
+            lines.append('# TYPE {} counter'.format(name))
+
+            for (service, operation), stats in api:
+                lines.append('{}{{service="{}",operation="{}"}} {}'.format(
+                    name, service, operation, getattr(stats, attribute)
+                ))
+
+        def histogram(name, help_text, series):
+            lines.append('# HELP {} {}'.format(name, help_text))
+            lines.append('# TYPE {} histogram'.format(name))
+
+            for labels, values in series:
+                cumulative = 0
+
+                for bound, count in zip(BUCKETS, values.counts):
+                    cumulative += count
+                    lines.append('{}_bucket{{{},le="{}"}} {}'.format(
+                        name, labels, '+Inf' if bound == float('inf') else bound, cumulative
+                    ))
+
+                lines.append('{}_sum{{{}}} {}'.format(name, labels, values.sum))
+                lines.append('{}_count{{{}}} {}'.format(name, labels, values.count))
+
+        api = self.api()
+
+        counter('aws_top_api_calls_total', 'AWS API calls made by aws-top.', 'calls')
+        counter('aws_top_api_errors_total', 'AWS API calls that returned an error.', 'errors')
+        counter('aws_top_api_retries_total', 'Retries made by botocore.', 'retries')
+        counter('aws_top_api_throttles_total', 'Attempts rejected by AWS throttling.', 'throttles')
+        histogram('aws_top_api_latency_seconds', 'Latency of AWS API calls including retries.', [
+            ('service="{}",operation="{}"'.format(service, operation), stats.latency)
+            for (service, operation), stats in api
+        ])
+        histogram('aws_top_ui_seconds', 'Time spent updating and rendering windows.', [
+            ('name="{}"'.format(name), values) for name, values in self.ui()
+        ])
+
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path):
+        # written to a temporary file first, so that the node exporter never reads a partial file
+        temporary = '{}.{}.tmp'.format(path, os.getpid())
+
+        with open(temporary, 'w') as output:
+            output.write(self.prometheus())
+
+        os.replace(temporary, path)
+
+
+class _Timer:
+    __slots__ = ('__stats', '__name', '__started')
+
+    def __init__(self, stats, name):
+        self.__stats = stats
+        self.__name = name
+
+    def __enter__(self):
+        self.__started = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.__stats.observe(self.__name, time.perf_counter() - self.__started)
+
+
+stats = Stats()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+import bisect
+import collections
+
+
+class GroupKey(collections.namedtuple('GroupKey', ['value'])):
+    # table key of a group header row
+    pass
+
+
+def _comparable(value):
+    # None sorts last and may be compared with anything, e.g. the account of a key
+    if isinstance(value, tuple):
+        return tuple(_comparable(part) for part in value)
+
+    return (1, '') if value is None else (0, value)
+
+
+class SortedKeys:
+    # Keys ordered by value_of(key), kept sorted with bisect as resources are added, removed or
+    # change, so that a refresh moves a few rows instead of sorting the whole table again.
+
+    def __init__(self, value_of, keys=()):
+        self.__value_of = value_of
+        self.__entries = sorted(self.__entry(key) for key in keys)
+        self.__by_key = {entry[2]: entry for entry in self.__entries}
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def __entry(self, key):
+        return _comparable(self.__value_of(key)), _comparable(key), key
+
+    def add(self, key):
+        self.remove(key)
+        entry = self.__entry(key)
+        bisect.insort(self.__entries, entry)
+        self.__by_key[key] = entry
+
+    def remove(self, key):
+        entry = self.__by_key.pop(key, None)
+
+        if entry is not None:
+            del self.__entries[bisect.bisect_left(self.__entries, entry)]
+
+    def update(self, keys):
+        # moves keys whose value changed, returns True if the order changed
+        moved = False
+
+        for key in keys:
+            entry = self.__by_key.get(key)
+
+            if entry is not None and entry[0] != _comparable(self.__value_of(key)):
+                self.add(key)
+                moved = True
+
+        return moved
+
+    def apply(self, diff):
+        for key in diff.removed:
+            self.remove(key)
+
+        for key in diff.added:
+            self.add(key)
+
+        return self.update(diff.changed)
+
+    def keys(self, descending=False):
+        if not descending:
+            return [entry[2] for entry in self.__entries]
+
+        # resources without a value stay at the end in both directions
+        missing = bisect.bisect_left(self.__entries, (_comparable(None),))
+
+        return (
+            [entry[2] for entry in reversed(self.__entries[:missing])] +
+            [entry[2] for entry in self.__entries[missing:]]
+        )
+
+
+class GroupCounts:
+    # Number of resources per group and, within each group, per value of the summary field,
+    # e.g. instances per availability zone broken down by state.
+
+    def __init__(self, group_of, summary_of=None, items=()):
+        self.__group_of = group_of
+        self.__summary_of = summary_of or (lambda item: None)
+        self.__counts = collections.defaultdict(collections.Counter)
+        self.__by_key = {}
+
+        for key, item in items:
+            self.add(key, item)
+
+    def add(self, key, item):
+        self.remove(key)
+        group, summary = self.__group_of(item), self.__summary_of(item)
+        self.__counts[group][summary] += 1
+        self.__by_key[key] = (group, summary)
+
+    def remove(self, key):
+        previous = self.__by_key.pop(key, None)
+
+        if previous is None:
+            return
+
+        group, summary = previous
+        counts = self.__counts[group]
+        counts[summary] -= 1
+
+        if counts[summary] <= 0:
+            del counts[summary]
+
+        if not counts:
+            del self.__counts[group]
+
+    def apply(self, diff):
+        for key in diff.removed:
+            self.remove(key)
+
+        for key, item in diff.added.items():
+            self.add(key, item)
+
+        for key, (old, new, fields) in diff.changed.items():
+            self.add(key, new)
+
+    def group(self, key):
+        return self.__by_key[key][0]
+
+    def groups(self):
+        return sorted(self.__counts, key=_comparable)
+
+    def count(self, group):
+        return sum(self.__counts[group].values())
+
+    def summary(self, group):
+        # [(summary value, count)] with the most frequent first
+        return [(value, count) for value, count in self.__counts[group].most_common() if value is not None]
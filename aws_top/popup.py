@@ -1,35 +1,26 @@
 #!/usr/bin/env python3
+import time
 
 import urwid
 
 import aws_top.aws
+import aws_top.instrumentation
 import aws_top.signals
 
 
 class RegionSelectorDialog(urwid.WidgetWrap):
-    signals = [aws_top.signals.CLOSE]
+    signals = [aws_top.signals.CLOSE, aws_top.signals.REGION_CHANGE]
+    ALL_REGIONS = 'All regions'
+    MAX_HEIGHT = 24
 
     def __init__(self):
-        self.__regions = [
-            "us-east-1",
-            "us-east-2",
-            "us-west-1",
-            "us-west-2",
-            "ca-central-1",
-            "eu-west-1",
-            "eu-central-1",
-            "eu-west-2",
-            "eu-west-3",
-            "ap-northeast-1",
-            "ap-northeast-2",
-            "ap-southeast-1",
-            "ap-southeast-2",
-            "ap-south-1",
-            "sa-east-1",
-            "us-gov-west-1",
-        ]
+        # built when opened, from the regions discovered in the background
+        self.__regions = aws_top.aws.get_available_regions() + [self.ALL_REGIONS]
 
-        current_region = aws_top.aws.get_region()
+        if aws_top.aws.is_all_regions():
+            current_region = self.ALL_REGIONS
+        else:
+            current_region = aws_top.aws.get_region()
 
         body = []
 
@@ -40,11 +31,12 @@ class RegionSelectorDialog(urwid.WidgetWrap):
 
             body.append(urwid.AttrMap(button, None, focus_map='reversed'))
 
-        body = urwid.Pile(body)
+        # scrolls when there are more regions than fit on the screen
+        body = urwid.ListBox(urwid.SimpleFocusListWalker(body))
 
-        body.focus_position = self.__regions.index(current_region)
+        if current_region in self.__regions:
+            body.set_focus(self.__regions.index(current_region))
 
-        body = urwid.Filler(body, valign=urwid.TOP)
         body = urwid.LineBox(body, title='Select Region')
 
         super(RegionSelectorDialog, self).__init__(urwid.AttrWrap(body, 'popbg'))
@@ -55,10 +47,15 @@ class RegionSelectorDialog(urwid.WidgetWrap):
 
     @property
     def height(self):
-        return 2 + len(self.__regions)
+        return min(2 + len(self.__regions), self.MAX_HEIGHT)
 
     def __set_region(self, button, region):
-        aws_top.aws.set_region(region)
+        if region == self.ALL_REGIONS:
+            aws_top.aws.set_all_regions(True)
+        else:
+            aws_top.aws.set_region(region)
+
+        self._emit(aws_top.signals.REGION_CHANGE, region)
         self._emit(aws_top.signals.CLOSE)
 
 
@@ -98,19 +95,73 @@ class ServiceSelectorDialog(urwid.WidgetWrap):
         self._emit(aws_top.signals.CLOSE)
 
 
+class StatsDialog(urwid.WidgetWrap):
+    # snapshot of aws_top.instrumentation.stats taken when the dialog is opened
+    signals = [aws_top.signals.CLOSE]
+    MAX_HEIGHT = 30
+
+    def __init__(self, stats=aws_top.instrumentation.stats):
+        calls, throttles = stats.totals()
+        self.__lines = [
+            'AWS API calls: {}, throttled: {}, since {}'.format(
+                calls, throttles, time.strftime('%H:%M:%S', time.localtime(stats.started))
+            ),
+            '',
+            '{:<36} {:>7} {:>6} {:>7} {:>9} {:>7} {:>7} {:>7}'.format(
+                'Operation', 'Calls', 'Errors', 'Retries', 'Throttles', 'Avg ms', 'p95 ms', 'Max ms'
+            )
+        ]
+
+        for (service, operation), api in stats.api():
+            self.__lines.append('{:<36} {:>7} {:>6} {:>7} {:>9} {:>7.0f} {:>7.0f} {:>7.0f}'.format(
+                '{}.{}'.format(service, operation)[:36], api.calls, api.errors, api.retries, api.throttles,
+                api.latency.average * 1000, api.latency.quantile(0.95) * 1000, api.latency.max * 1000
+            ))
+
+        self.__lines += ['', '{:<36} {:>7} {:>7} {:>7} {:>7}'.format('Window', 'Count', 'Avg ms', 'p95 ms', 'Max ms')]
+
+        for name, timings in stats.ui():
+            self.__lines.append('{:<36} {:>7} {:>7.1f} {:>7.1f} {:>7.1f}'.format(
+                name, timings.count, timings.average * 1000, timings.quantile(0.95) * 1000, timings.max * 1000
+            ))
+
+        body = urwid.ListBox(urwid.SimpleFocusListWalker([urwid.Text(line, wrap=urwid.CLIP) for line in self.__lines]))
+        body = urwid.LineBox(body, title='Statistics (Esc to close)')
+
+        super(StatsDialog, self).__init__(urwid.AttrWrap(body, 'popbg'))
+
+    @property
+    def width(self):
+        return 4 + max(len(line) for line in self.__lines)
+
+    @property
+    def height(self):
+        return min(2 + len(self.__lines), self.MAX_HEIGHT)
+
+    def keypress(self, size, key):
+        if key in ('esc', 'q', 'enter'):
+            self._emit(aws_top.signals.CLOSE)
+            return None
+
+        return super(StatsDialog, self).keypress(size, key)
+
+
 class GenerousPopUpLauncher(urwid.PopUpLauncher):
     def __init__(self, w, popup):
         super(GenerousPopUpLauncher, self).__init__(w)
         self.__popup = popup
 
     def create_pop_up(self):
+        # popup is either a dialog or a factory that builds the dialog when it is first opened
+        popup = self.__popup() if callable(self.__popup) else self.__popup
+
         urwid.connect_signal(
-            self.__popup,
+            popup,
             aws_top.signals.CLOSE,
             lambda button: self.close_pop_up()
         )
 
-        return self.__popup
+        return popup
 
     def get_pop_up_parameters(self):
         size = urwid.raw_display.Screen().get_cols_rows()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+import collections
+import contextlib
+import threading
+import time
+
+# calls per second of the whole process, 0 disables the limit
+DEFAULT_RATE = 25
+# share of the process rate a single service and API family, e.g. ec2 Describe*, may use
+FAMILY_SHARE = 0.5
+# seconds the budget use shown in the status bar is averaged over
+WINDOW = 5
+
+
+def api_family(operation):
+    # DescribeInstances -> Describe, GetMetricData -> Get
+    for i, char in enumerate(operation[1:], 1):
+        if char.isupper():
+            return operation[:i]
+
+    return operation
+
+
+class TokenBucket:
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def delay(self, now):
+        # seconds until a token is available
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+
+class RateLimiter:
+    # Every attempt of an AWS call made through aws.clients takes a token of the process-wide
+    # bucket and one of its service and API family, so that aws-top stays well below the quotas it
+    # shares with other tools. Calls of background work, e.g. services that are not shown, wait
+    # while calls of the shown service are waiting.
+
+    def __init__(self, rate=DEFAULT_RATE):
+        self.__condition = threading.Condition()
+        self.__local = threading.local()
+        self.__waiting = {False: 0, True: 0}
+        self.__recent = collections.deque()
+        self.set_rate(rate)
+
+    @property
+    def rate(self):
+        return self.__rate
+
+    def set_rate(self, rate):
+        with self.__condition:
+            self.__rate = rate
+            self.__global = TokenBucket(rate) if rate else None
+            self.__families = {}
+            self.__condition.notify_all()
+
+    def attach(self, client):
+        service = client.meta.service_model.service_name
+
+        # emitted for every attempt including retries, before the request is signed
+        client.meta.events.register_first(
+            'request-created.*.*',
+            lambda operation_name=None, **kwargs: self.acquire(service, operation_name)
+        )
+
+        return client
+
+    @contextlib.contextmanager
+    def background(self, enabled=True):
+        # calls made by this thread within the block have a lower priority
+        previous = self.is_background()
+        self.__local.background = enabled
+
+        try:
+            yield
+        finally:
+            self.__local.background = previous
+
+    def is_background(self):
+        return getattr(self.__local, 'background', False)
+
+    def inherit(self, func):
+        # func with the priority of the calling thread, for work handed to other threads
+        background = self.is_background()
+
+        def run(*args, **kwargs):
+            with self.background(background):
+                return func(*args, **kwargs)
+
+        return run
+
+    def acquire(self, service, operation):
+        background = self.is_background()
+
+        with self.__condition:
+            if self.__global is not None:
+                buckets = (self.__global, self.__family(service, operation))
+                self.__waiting[background] += 1
+
+                try:
+                    while True:
+                        delay = max(bucket.delay(time.monotonic()) for bucket in buckets)
+
+                        # background calls leave free tokens to the shown service
+                        if background and self.__waiting[False]:
+                            delay = max(delay, 0.05)
+
+                        if delay <= 0:
+                            break
+
+                        self.__condition.wait(delay)
+
+                    for bucket in buckets:
+                        bucket.take()
+                finally:
+                    self.__waiting[background] -= 1
+                    self.__condition.notify_all()
+
+            now = time.monotonic()
+            self.__recent.append(now)
+            self.__trim(now)
+
+    def __family(self, service, operation):
+        key = (service, api_family(operation or ''))
+        bucket = self.__families.get(key)
+
+        if bucket is None:
+            bucket = self.__families[key] = TokenBucket(max(self.__rate * FAMILY_SHARE, 1))
+
+        return bucket
+
+    def usage(self):
+        # (calls per second over the last WINDOW seconds, calls waiting for a token)
+        with self.__condition:
+            self.__trim(time.monotonic())
+
+            return len(self.__recent) / float(WINDOW), sum(self.__waiting.values())
+
+    def __trim(self, now):
+        while self.__recent and self.__recent[0] < now - WINDOW:
+            self.__recent.popleft()
+
+
+limiter = RateLimiter()
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+import base64
+import collections
+import datetime
+import gzip
+import json
+import threading
+import time
+
+# A recording is a gzip compressed stream of JSON lines. The first line describes the recording,
+# every response follows as two lines: its metadata, i.e. when it arrived, how long the call took,
+# the client, the operation and its parameters, and then the parsed response itself. Replaying
+# only decodes the small metadata lines up front and each response when it is used.
+FORMAT_VERSION = 1
+TIMINGS = ('original', 'fast')
+
+_active = None
+
+
+def _encode(value):
+    if isinstance(value, datetime.datetime):
+        return {'$dt': value.isoformat()}
+
+    if isinstance(value, bytes):
+        return {'$b': base64.b64encode(value).decode('ascii')}
+
+    raise TypeError('{} is not recorded'.format(type(value).__name__))
+
+
+def _decode(obj):
+    if len(obj) == 1 and '$dt' in obj:
+        from botocore.utils import parse_timestamp
+
+        return parse_timestamp(obj['$dt'])
+
+    if len(obj) == 1 and '$b' in obj:
+        return base64.b64decode(obj['$b'])
+
+    return obj
+
+
+def _dumps(value):
+    return json.dumps(value, default=_encode, separators=(',', ':'))
+
+
+def _key(service, region, account, operation, params):
+    # times in the parameters, e.g. of GetMetricData, differ between recording and replay
+    def ignore_times(value):
+        if isinstance(value, datetime.datetime):
+            return None
+
+        return _encode(value)
+
+    return json.dumps([service, region, account, operation, params], default=ignore_times, sort_keys=True)
+
+
+def _capture_params(params=None, context=None, **kwargs):
+    # the parameters of the API call, before-call only sees the serialized request
+    if context is not None:
+        try:
+            context['aws_top_params'] = json.loads(_dumps(params or {}), object_hook=_decode)
+        except TypeError:
+            # e.g. a file to upload, such calls are not recorded
+            context['aws_top_params'] = None
+
+
+class Recorder:
+    def __init__(self, path):
+        self.__file = gzip.open(path, 'wt', encoding='utf-8')
+        self.__lock = threading.Lock()
+        self.__started = time.time()
+        self.__write([{'version': FORMAT_VERSION, 'started': self.__started}])
+
+    def attach(self, client, region, account):
+        events = client.meta.events
+        service = client.meta.service_model.service_name
+
+        events.register('before-parameter-build.*.*', _capture_params)
+        events.register('before-call.*.*', self.__before_call)
+        events.register('after-call.*.*', lambda **kwargs: self.__after_call(service, region, account, **kwargs))
+
+    @staticmethod
+    def __before_call(context=None, **kwargs):
+        if context is not None:
+            context['aws_top_recorded'] = time.perf_counter()
+
+    def __after_call(self, service, region, account, model=None, parsed=None, http_response=None, context=None,
+                     **kwargs):
+        context = context or {}
+        started = context.get('aws_top_recorded')
+        body = dict(parsed or {})
+        metadata = body.pop('ResponseMetadata', {})
+
+        if context.get('aws_top_params') is None:
+            return
+
+        self.__write([
+            {
+                't': round(time.time() - self.__started, 3),
+                'd': round(time.perf_counter() - started, 4) if started is not None else 0,
+                's': service,
+                'r': region,
+                'a': account,
+                'o': model.name,
+                'p': context.get('aws_top_params', {}),
+                'c': metadata.get('HTTPStatusCode') or getattr(http_response, 'status_code', 200)
+            },
+            body
+        ])
+
+    def __write(self, values):
+        try:
+            lines = ''.join(_dumps(value) + '\n' for value in values)
+        except TypeError:
+            # streamed responses like S3 objects are not recorded
+            return
+
+        # flushed with every response, so that a recording is usable up to a crash
+        with self.__lock:
+            if not self.__file.closed:
+                self.__file.write(lines)
+                self.__file.flush()
+
+    def close(self):
+        with self.__lock:
+            self.__file.close()
+
+
+class Replayer:
+    # Answers calls with the recorded responses of the same client, operation and parameters in
+    # the order they were recorded. Once they are used up the last one is repeated, so refreshes
+    # continue after the end of the recording.
+
+    def __init__(self, path, timing='original'):
+        self.timing = timing
+        self.region = None
+        self.__lock = threading.Lock()
+        self.__responses = collections.defaultdict(collections.deque)
+        self.__last = {}
+
+        with gzip.open(path, 'rt', encoding='utf-8') as recording:
+            header = json.loads(next(recording, '{}'))
+
+            if header.get('version') != FORMAT_VERSION:
+                raise ValueError('unsupported recording version {}'.format(header.get('version')))
+
+            try:
+                for line in recording:
+                    body = next(recording, '')
+
+                    # a recording that was not closed, e.g. after a crash, may end within a response
+                    if not body.endswith('\n'):
+                        break
+
+                    metadata = json.loads(line, object_hook=_decode)
+                    key = _key(metadata['s'], metadata['r'], metadata['a'], metadata['o'], metadata['p'])
+                    self.__responses[key].append((metadata['d'], metadata['c'], body))
+                    # the region that was shown, used unless another one is given
+                    self.region = self.region or metadata['r']
+            except EOFError:
+                # the compressed stream of a recording that was not closed has no end marker
+                pass
+
+    def attach(self, client, region, account):
+        events = client.meta.events
+        service = client.meta.service_model.service_name
+
+        events.register('before-parameter-build.*.*', _capture_params)
+        events.register(
+            'before-call.*.*',
+            lambda model=None, context=None, **kwargs: self.__respond(service, region, account, model, context)
+        )
+
+    def __respond(self, service, region, account, model, context):
+        key = _key(service, region, account, model.name, (context or {}).get('aws_top_params', {}))
+
+        with self.__lock:
+            responses = self.__responses.get(key)
+
+            if responses:
+                self.__last[key] = responses.popleft()
+
+            response = self.__last.get(key)
+
+        if response is None:
+            import botocore.exceptions
+
+            raise botocore.exceptions.ClientError(
+                {'Error': {'Code': 'NotRecorded', 'Message': 'No recorded response for these parameters'}},
+                model.name
+            )
+
+        duration, status, body = response
+
+        if self.timing == 'original':
+            time.sleep(duration)
+
+        from botocore.awsrequest import AWSResponse
+
+        parsed = json.loads(body, object_hook=_decode)
+        parsed['ResponseMetadata'] = {'HTTPStatusCode': status, 'HTTPHeaders': {}, 'RetryAttempts': 0}
+
+        # returning a response from before-call skips the request, like botocore's Stubber
+        return AWSResponse(None, status, {}, None), parsed
+
+
+def record(path):
+    global _active
+    _active = Recorder(path)
+
+
+def replay(path, timing='original'):
+    global _active
+    _active = Replayer(path, timing)
+
+    return _active
+
+
+def attach(client, region, account):
+    # called by aws.clients for every new client
+    if _active is not None:
+        _active.attach(client, region, account)
+
+
+def stop():
+    global _active
+
+    if isinstance(_active, Recorder):
+        _active.close()
+
+    _active = None
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+import concurrent.futures
+import os
+import queue
+import threading
+import time
+import types
+
+from aws_top.ratelimit import limiter
+
+
+class RefreshEngine:
+    def __init__(self, loop, max_workers=4):
+        self.__executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+        self.__results = queue.Queue()
+        self.__pending = {}
+        self.__pipe = loop.watch_pipe(self.__on_results)
+
+    def is_pending(self, key):
+        return key in self.__pending
+
+    def submit(self, key, fetch, callback, progress=None, background=False):
+        # fetch runs on a worker thread, callback on the urwid loop with the finished future.
+        # If fetch returns a generator, every item it yields is passed to progress on the loop.
+        # AWS calls of background jobs wait while those of other jobs are waiting for the rate limit.
+        if key in self.__pending:
+            return False
+
+        cancelled = threading.Event()
+        future = self.__executor.submit(self.__run, fetch, progress, cancelled, background)
+        self.__pending[key] = (future, cancelled)
+        future.add_done_callback(lambda f: self.__post(self.__finish, key, f, callback, cancelled))
+
+        return True
+
+    def cancel(self, key):
+        # Neither the callback nor pending progress are called for a cancelled job. A generator
+        # stops at its next page, a request that is already sent runs to its end on the worker.
+        future, cancelled = self.__pending.pop(key, (None, None))
+
+        if future is not None:
+            cancelled.set()
+            future.cancel()
+
+    def __run(self, fetch, progress, cancelled, background):
+        with limiter.background(background):
+            return self.__fetch(fetch, progress, cancelled)
+
+    def __fetch(self, fetch, progress, cancelled):
+        result = fetch()
+
+        if not isinstance(result, types.GeneratorType):
+            return result
+
+        try:
+            for page in result:
+                if cancelled.is_set():
+                    break
+
+                if progress:
+                    self.__post(self.__progress, progress, page, cancelled)
+        finally:
+            result.close()
+
+    @staticmethod
+    def __progress(progress, page, cancelled):
+        if not cancelled.is_set():
+            progress(page)
+
+    def __finish(self, key, future, callback, cancelled):
+        if cancelled.is_set():
+            return
+
+        if self.__pending.get(key, (None,))[0] is future:
+            del self.__pending[key]
+
+        callback(future)
+
+    def __post(self, func, *args):
+        self.__results.put((func, args))
+
+        try:
+            os.write(self.__pipe, b'.')
+        except OSError:
+            pass
+
+    def __on_results(self, data):
+        while True:
+            try:
+                func, args = self.__results.get_nowait()
+            except queue.Empty:
+                break
+
+            func(*args)
+
+        return True
+
+    def shutdown(self):
+        self.__executor.shutdown(wait=False)
+
+
+class RefreshStatus:
+    def __init__(self):
+        self.refreshing = False
+        self.last_updated = None
+
+    def started(self):
+        self.refreshing = True
+
+    def finished(self):
+        self.refreshing = False
+        self.last_updated = time.time()
+
+    def describe(self):
+        if self.refreshing:
+            return 'Refreshing...'
+
+        if self.last_updated is None:
+            return 'Waiting for data'
+
+        return 'Updated {}s ago'.format(int(time.time() - self.last_updated))
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+import random
+import time
+
+from aws_top.refresh import RefreshStatus
+
+DEFAULT_INTERVALS = {
+    'EC2': 5,
+    'S3': 300,
+    'Lambda': 10,
+    'DynamoDB': 30
+}
+
+# services that are not shown are refreshed this many times less often
+BACKGROUND_FACTOR = 4
+
+THROTTLING_ERRORS = frozenset([
+    'Throttling',
+    'ThrottlingException',
+    'RequestLimitExceeded',
+    'TooManyRequestsException',
+    'SlowDown'
+])
+
+
+def is_throttling_error(error):
+    response = getattr(error, 'response', None) or {}
+    return response.get('Error', {}).get('Code') in THROTTLING_ERRORS
+
+
+class RefreshSchedule(RefreshStatus):
+    def __init__(self, interval, fast_interval=1, fast_duration=30, max_interval=300):
+        super(RefreshSchedule, self).__init__()
+        self.base_interval = interval
+        self.interval = interval
+        self.fast_interval = min(fast_interval, interval)
+        self.fast_duration = fast_duration
+        self.max_interval = max(max_interval, interval)
+        self.__next_run = 0
+        self.__fast_until = 0
+        self.__throttled = 0
+
+    def due(self, now=None, background=False):
+        next_run = self.__next_run
+
+        if background and next_run:
+            next_run += (BACKGROUND_FACTOR - 1) * self.interval
+
+        return not self.refreshing and (now or time.time()) >= next_run
+
+    def expedite(self):
+        # due as soon as the running refresh, if any, has finished
+        self.__next_run = 0
+
+    def reset(self):
+        # for a new region, its refresh is due at once and nothing has been fetched yet
+        self.refreshing = False
+        self.last_updated = None
+        self.interval = self.base_interval
+        self.__next_run = 0
+        self.__fast_until = 0
+        self.__throttled = 0
+
+    def succeeded(self, transitioning=False, now=None):
+        now = now or time.time()
+        self.finished()
+        self.__throttled = 0
+
+        # poll faster for a while when resources are in a transitional state
+        if transitioning:
+            self.__fast_until = now + self.fast_duration
+
+        self.interval = self.fast_interval if now < self.__fast_until else self.base_interval
+        self.__next_run = now + self.interval
+
+    def failed(self, error, now=None):
+        now = now or time.time()
+        self.finished()
+
+        if is_throttling_error(error):
+            # exponential backoff with "equal jitter"
+            self.__throttled += 1
+            ceiling = min(self.max_interval, self.base_interval * 2 ** self.__throttled)
+            self.interval = ceiling / 2 + random.uniform(0, ceiling / 2)
+        else:
+            self.interval = self.base_interval
+
+        self.__next_run = now + self.interval
+
+    def describe(self):
+        return '{} (every {}s)'.format(
+            super(RefreshSchedule, self).describe(),
+            _format_interval(self.interval)
+        )
+
+
+def _format_interval(interval):
+    return '{:g}'.format(round(interval, 1))
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+import collections
+
+
+def parse_query(text, prefixes=()):
+    # Splits a filter bar query into {prefix: [values]} for words like state:running,stopped
+    # whose prefix is known, and lowercased free-text terms for everything else.
+    filters = collections.OrderedDict()
+    terms = []
+
+    for word in text.split():
+        prefix, separator, value = word.partition(':')
+
+        if separator and value and prefix.lower() in prefixes:
+            filters.setdefault(prefix.lower(), []).extend(part for part in value.split(',') if part)
+        else:
+            terms.append(word.lower())
+
+    return filters, terms
+
+
+class SearchTexts:
+    # Lowercased searchable text of every row, kept up to date from snapshot diffs. A search scans
+    # these texts, which is faster than building a trigram index over them, and while typing only
+    # the matches of the previous query are scanned again.
+
+    def __init__(self, text_of):
+        self.__text_of = text_of
+        self.__texts = {}
+        self.__last = None
+
+    def __len__(self):
+        return len(self.__texts)
+
+    def add(self, key, item):
+        self.__texts[key] = self.__text_of(item).lower()
+        self.__last = None
+
+    def remove(self, key):
+        if self.__texts.pop(key, None) is not None:
+            self.__last = None
+
+    def update(self, diff):
+        for key in diff.removed:
+            self.remove(key)
+
+        for key, item in diff.added.items():
+            self.add(key, item)
+
+        for key, (old, new, fields) in diff.changed.items():
+            self.add(key, new)
+
+    def search(self, terms):
+        # set of keys whose text contains all terms
+        terms = tuple(terms)
+
+        if self.__last and self.__last[0] == terms:
+            return self.__last[1]
+
+        # while typing, the new query usually extends the previous one and only its matches need checking
+        if self.__last and self.__refines(self.__last[0], terms):
+            matches = self.__last[1]
+            # terms of the previous query are contained in all of its matches
+            pending = [term for term in terms if term not in self.__last[0]]
+        else:
+            matches = self.__texts.keys()
+            pending = terms
+
+        texts = self.__texts
+
+        for term in sorted(pending, key=len, reverse=True):
+            matches = [key for key in matches if term in texts[key]]
+
+        matches = set(matches)
+        self.__last = (terms, matches)
+
+        return matches
+
+    @staticmethod
+    def __refines(previous, terms):
+        # every previous term is contained in one of the new ones, so no new row can match
+        return bool(previous) and all(any(old in new for new in terms) for old in previous)
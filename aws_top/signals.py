@@ -3,4 +3,7 @@
 CLOSE = 'close'
 CLICK = 'click'
 SERVICE_CHANGE = 'service_change'
+REGION_CHANGE = 'region_change'
 
+QUERY_CHANGE = 'query_change'
+QUERY_APPLY = 'query_apply'
@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+import time
+
+
+class StartupProfile:
+    # records how long each startup phase took, relative to the previous one and to the start
+
+    def __init__(self, started=None):
+        self.__started = started or time.perf_counter()
+        self.__last = self.__started
+        self.__phases = []
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.__phases.append((phase, now - self.__last, now - self.__started))
+        self.__last = now
+
+    def has(self, phase):
+        return any(name == phase for name, duration, elapsed in self.__phases)
+
+    def report(self):
+        width = max([len(name) for name, duration, elapsed in self.__phases] + [len('phase')])
+        lines = ['{:<{}}  {:>10}  {:>10}'.format('phase', width, 'duration', 'elapsed')]
+
+        for name, duration, elapsed in self.__phases:
+            lines.append('{:<{}}  {:7.1f} ms  {:7.1f} ms'.format(name, width, duration * 1000, elapsed * 1000))
+
+        return '\n'.join(lines)
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+import collections
+
+import urwid
+
+
+class TableRow(urwid.Columns):
+    def selectable(self):
+        return True
+
+    def keypress(self, size, key):
+        return key
+
+
+class TableWalker(urwid.ListWalker):
+    # Row widgets are built on demand and only the most recently displayed ones are kept,
+    # so the cost of a frame depends on the viewport height rather than the number of rows.
+
+    def __init__(self, build_row, cache_size=256):
+        self.__build_row = build_row
+        self.__cache_size = cache_size
+        self.__rows = collections.OrderedDict()
+        self.__keys = []
+        self.__index = {}
+        self.__focus = 0
+
+    def __len__(self):
+        return len(self.__keys)
+
+    @property
+    def keys(self):
+        return self.__keys
+
+    @property
+    def focus_key(self):
+        return self.__keys[self.__focus] if self.__keys else None
+
+    def set_keys(self, keys):
+        focus_key = self.focus_key
+
+        self.__keys = list(keys)
+        self.__index = {key: i for i, key in enumerate(self.__keys)}
+        self.__focus = self.__index.get(focus_key, min(self.__focus, max(len(self.__keys) - 1, 0)))
+
+        for key in [key for key in self.__rows if key not in self.__index]:
+            del self.__rows[key]
+
+        self._modified()
+
+    def append_keys(self, keys):
+        # cheaper than set_keys while rows are still arriving page by page
+        for key in keys:
+            self.__index[key] = len(self.__keys)
+            self.__keys.append(key)
+
+        self._modified()
+
+    def invalidate(self, keys):
+        changed = False
+
+        for key in keys:
+            if self.__rows.pop(key, None) is not None:
+                changed = True
+
+        if changed:
+            self._modified()
+
+    def __row(self, position):
+        key = self.__keys[position]
+        row = self.__rows.pop(key, None)
+
+        if row is None:
+            row = self.__build_row(key)
+
+        self.__rows[key] = row
+
+        while len(self.__rows) > self.__cache_size:
+            self.__rows.popitem(last=False)
+
+        return row
+
+    def get_focus(self):
+        if not self.__keys:
+            return None, None
+
+        return self.__row(self.__focus), self.__focus
+
+    def set_focus(self, position):
+        self.__focus = position
+        self._modified()
+
+    def get_next(self, position):
+        if position + 1 >= len(self.__keys):
+            return None, None
+
+        return self.__row(position + 1), position + 1
+
+    def get_prev(self, position):
+        if position <= 0:
+            return None, None
+
+        return self.__row(position - 1), position - 1
+
+
+class Table(urwid.WidgetWrap):
+    def __init__(self, header, build_row):
+        self.__walker = TableWalker(build_row)
+        self.__listbox = urwid.ListBox(self.__walker)
+        self.__message = None
+        self.__frame = urwid.Frame(self.__listbox)
+        self.set_header(header)
+
+        super(Table, self).__init__(self.__frame)
+
+    def __len__(self):
+        return len(self.__walker)
+
+    @property
+    def selected_key(self):
+        return self.__walker.focus_key
+
+    def set_keys(self, keys):
+        self.__walker.set_keys(keys)
+
+    def append_keys(self, keys):
+        self.__walker.append_keys(keys)
+
+    def refresh_rows(self, keys):
+        self.__walker.invalidate(keys)
+
+    def set_message(self, markup):
+        if markup == self.__message:
+            return
+
+        self.__message = markup
+
+        if markup is None:
+            self.__frame.body = self.__listbox
+        else:
+            self.__frame.body = urwid.Filler(urwid.Text(markup, align=urwid.CENTER), valign=urwid.TOP)
+
+    def set_header(self, header):
+        self.__frame.header = urwid.AttrMap(urwid.Columns(header, dividechars=1), 'bold')
+
+    def set_footer(self, markup):
+        self.__frame.footer = urwid.Text(markup, align=urwid.CENTER) if markup else None
+
+    def keypress(self, size, key):
+        if self.__message is None and len(self.__walker):
+            if key == 'home':
+                self.__listbox.set_focus(0, coming_from='below')
+                return None
+
+            if key == 'end':
+                self.__listbox.set_focus(len(self.__walker) - 1, coming_from='above')
+                return None
+
+        return super(Table, self).keypress(size, key)
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+import array
+
+DEFAULT_HISTORY = 30
+
+
+class RingBuffer:
+    __slots__ = ('__values', '__next', '__full', 'last_timestamp')
+
+    def __init__(self, capacity):
+        self.__values = array.array('d', bytes(8 * capacity))
+        self.__next = 0
+        self.__full = False
+        self.last_timestamp = None
+
+    def __len__(self):
+        return len(self.__values) if self.__full else self.__next
+
+    def append(self, value):
+        self.__values[self.__next] = value
+        self.__next = (self.__next + 1) % len(self.__values)
+
+        if self.__next == 0:
+            self.__full = True
+
+    def values(self):
+        if not self.__full:
+            return self.__values[:self.__next].tolist()
+
+        return self.__values[self.__next:].tolist() + self.__values[:self.__next].tolist()
+
+    def latest(self):
+        if not len(self):
+            return None
+
+        return self.__values[self.__next - 1]
+
+
+class TimeSeriesStore:
+    # One fixed-size buffer of doubles per (resource, metric), so memory use only depends on
+    # the number of tracked series and the configured history length.
+
+    def __init__(self, history=DEFAULT_HISTORY):
+        self.history = history
+        self.__series = {}
+
+    def __len__(self):
+        return sum(len(metrics) for metrics in self.__series.values())
+
+    def add(self, resource, metric, points):
+        # points is a list of (timestamp, value) tuples sorted by timestamp
+        metrics = self.__series.setdefault(resource, {})
+        buffer = metrics.get(metric)
+
+        if buffer is None:
+            buffer = metrics[metric] = RingBuffer(self.history)
+
+        added = False
+
+        for timestamp, value in points:
+            if buffer.last_timestamp is None or timestamp > buffer.last_timestamp:
+                buffer.append(value)
+                buffer.last_timestamp = timestamp
+                added = True
+
+        return added
+
+    def series(self, resource, metric):
+        buffer = self.__series.get(resource, {}).get(metric)
+        return buffer.values() if buffer else []
+
+    def latest(self, resource, metric):
+        buffer = self.__series.get(resource, {}).get(metric)
+        return buffer.latest() if buffer else None
+
+    def remove(self, resource):
+        self.__series.pop(resource, None)
@@ -1,212 +1,1035 @@
 #!/usr/bin/env python3
-import botocore.exceptions
+import collections
 import time
 
 import urwid
 
 import aws_top.aws
+import aws_top.instrumentation
+import aws_top.ordering
+import aws_top.ratelimit
+import aws_top.search
+import aws_top.signals
+import aws_top.timeseries
+from aws_top.ordering import GroupKey
+from aws_top.table import Table, TableRow
 
 
 class WindowManager:
-    ONE_EIGHT = '&#9601;'
-    ONE_QUARTER = '&#9602;'
-    THREE_EIGHTS = '&#9603;'
-    HALF = '&#9604;'
-    FIVE_EIGHTS = '&#9605;'
-    THREE_QUARTERS = '&#9606;'
-    SEVEN_EIGHTS = '&#9607;'
-    FULL = '&#9608;'
+    ONE_EIGHT = '\u2581'
+    ONE_QUARTER = '\u2582'
+    THREE_EIGHTS = '\u2583'
+    HALF = '\u2584'
+    FIVE_EIGHTS = '\u2585'
+    THREE_QUARTERS = '\u2586'
+    SEVEN_EIGHTS = '\u2587'
+    FULL = '\u2588'
+
+    BLOCKS = (ONE_EIGHT, ONE_QUARTER, THREE_EIGHTS, HALF, FIVE_EIGHTS, THREE_QUARTERS, SEVEN_EIGHTS, FULL)
+
+    @staticmethod
+    def sparkline(values, maximum=None):
+        if not values:
+            return ''
+
+        top = maximum if maximum is not None else max(values)
+        blocks = WindowManager.BLOCKS
+
+        if top <= 0:
+            return blocks[0] * len(values)
+
+        return ''.join(
+            blocks[min(len(blocks) - 1, max(0, int(value / top * (len(blocks) - 1) + 0.5)))]
+            for value in values
+        )
 
 
 class StatusWindow(urwid.Widget):
     _sizing = frozenset([urwid.BOX])
 
-    def __init__(self):
+    def __init__(self, refresh_status=None):
         super(StatusWindow, self).__init__()
         self.__time = None
-        self.__user = aws_top.aws.get_user()
+        # the caller identity or the accounts are looked up in the background once the screen is drawn
+        self.__user = '...'
         self.__region = None
+        self.__refresh_status = refresh_status
+        self.__budget = ''
 
         self.update()
 
+    def set_user(self, user):
+        self.__user = user
+        self._invalidate()
+
+    def set_refresh_status(self, refresh_status):
+        self.__refresh_status = refresh_status
+        self._invalidate()
+
     def update(self):
         self.__time = time.strftime(
             '%b %d %Y %H:%M:%S'
         )
-        self.__region = aws_top.aws.get_region()
+        if aws_top.aws.is_all_regions():
+            self.__region = 'all ({})'.format(len(aws_top.aws.get_target_regions()))
+        else:
+            self.__region = aws_top.aws.get_known_region() or '...'
+        self.__budget = self.__describe_budget(aws_top.ratelimit.limiter)
         self._invalidate()
 
+    @staticmethod
+    def __describe_budget(limiter):
+        rate, waiting = limiter.usage()
+
+        if not limiter.rate:
+            return 'API: {:.1f}/s'.format(rate)
+
+        return 'API: {:.0f}% of {:g}/s{}'.format(
+            100 * rate / limiter.rate, limiter.rate, ', {} waiting'.format(waiting) if waiting else ''
+        )
+
     def render(self, size, focus=False):
+        with aws_top.instrumentation.stats.timed('status.render'):
+            return self.__render(size)
+
+    def __render(self, size):
         body = [
-            urwid.Text('Logged in as: {}'.format(self.__user)),
-            urwid.Text('Region: {}'.format(self.__region), align=urwid.CENTER),
-            urwid.Text('Time: {}'.format(self.__time), align=urwid.RIGHT)
+            urwid.Text('Logged in as: {}'.format(self.__user), wrap=urwid.CLIP),
+            urwid.Text('Region: {}'.format(self.__region), align=urwid.CENTER, wrap=urwid.CLIP),
+            urwid.Text('Time: {}'.format(self.__time), align=urwid.RIGHT, wrap=urwid.CLIP)
         ]
 
+        if self.__refresh_status:
+            body.insert(2, urwid.Text(self.__refresh_status.describe(), align=urwid.CENTER, wrap=urwid.CLIP))
+
+        body.insert(-1, urwid.Text(self.__budget, align=urwid.CENTER, wrap=urwid.CLIP))
+
         return urwid.Columns(body).render((size[0],))
 
 
-class Ec2Window(urwid.Widget):
-    _sizing = frozenset([urwid.FLOW])
+class ServiceWindow(urwid.WidgetWrap):
+    HIGHLIGHT_SECONDS = 2
+    COLUMNS = ()
+    METRICS_NAMESPACE = None
+    METRICS_DIMENSION = None
+    METRICS = {}
+    METRICS_INTERVAL = 60
+    METRICS_PERIOD = 60
+    REGIONAL = True
+    # filter bar prefixes that are sent to AWS instead of being searched locally
+    FILTERS = ()
+    # columns the table can be sorted by (s, S reverses) and fields it can be grouped by (g)
+    SORT_COLUMNS = ()
+    GROUP_FIELDS = ()
+    # field counted per group in the group headers
+    SUMMARY_FIELD = None
+    # columns showing the latest value of a metric, sorted by it
+    METRIC_COLUMNS = {}
+    # columns of a fixed number of characters, the others share the rest of the screen
+    COLUMN_WIDTHS = {}
+    # sparkline columns, as wide as the metric history
+    HISTORY_COLUMNS = ()
+
+    def __init__(self, history=aws_top.timeseries.DEFAULT_HISTORY, cache=None):
+        self._items = None
+        self._error = None
+        self._failures = []
+        self._by_key = {}
+        self.multi_region = self.REGIONAL and aws_top.aws.is_all_regions()
+        self.multi_account = len(aws_top.aws.get_accounts()) > 0
+        self.__differ = aws_top.aws.SnapshotDiffer()
+        self.__highlights = {}
+        self.__incoming = []
+        self.__incoming_failures = []
+        self.__complete = False
+        self._metrics = aws_top.timeseries.TimeSeriesStore(history)
+        self.__metrics_fetchers = {}
+        self.__metrics_requested = 0
+        self.__cache = cache
+        # targets whose listing was saved since the window was created
+        self.__saved = set()
+        # lowercased row texts, only kept while a search is active
+        self.__texts = None
+        self.__terms = []
+        self.__visible = 0
+        self.__sort = None
+        self.__sorted = None
+        self.__group = None
+        self.__groups = None
+        self.__collapsed = set()
+        self.__shown = {}
+        self.filters = {}
+        self.stale_since = None
+        # (time, resources, removed keys) of events, re-applied over listings that started earlier
+        self.__changes = []
+        self.__listing_started = 0
+        # filters of the running listing, a filtered listing must not replace the complete one in the cache
+        self.__listing_filters = {}
+
+        self._table = Table(self.__header(), self.__build_row)
+        self._table.set_message(('warn', 'Loading...'))
+
+        if cache is not None:
+            self.__load_cached()
+
+        super(ServiceWindow, self).__init__(self._table)
+
+    def __header(self):
+        header = self.render_header()
+
+        if self.multi_region:
+            header.insert(0, urwid.Text('Region'))
+
+        if self.multi_account:
+            header.insert(0, urwid.Text('Account'))
+
+        if self.__sort:
+            column, descending = self.__sort
+            i = self.columns.index(column)
+            header[i] = urwid.Text(
+                '{} {}'.format(header[i].text, '\u25bc' if descending else '\u25b2'),
+                align=header[i].align
+            )
 
-    def __init__(self):
-        self.__instances = []
-        self.__error = None
-        self.update()
+        for cell in header:
+            cell.set_wrap_mode(urwid.CLIP)
+
+        return self.__sized(header)
+
+    def __sized(self, cells):
+        widths = dict(self.COLUMN_WIDTHS, **{column: self._metrics.history for column in self.HISTORY_COLUMNS})
+
+        return [
+            (widths[column], cell) if column in widths else cell
+            for column, cell in zip(self.columns, cells)
+        ]
+
+    def __load_cached(self):
+        # show the last known snapshot right away, marked as stale until the first refresh completes
+        items = []
+        saved_at = []
+
+        for target in self.targets():
+            cached = self.__cache.load(*self.cache_key(target))
+
+            if cached:
+                saved_at.append(cached[0])
+                items.extend(cached[1])
+
+        if saved_at:
+            self.stale_since = min(saved_at)
+            self.__commit(items)
+            self.__update_table()
+
+    def cache_key(self, target):
+        return target.account or aws_top.aws.get_identity_key(), target.region or '', self.SERVICE
+
+    def save_listing(self, diff, listed):
+        # Saves the listing of every target in listed whose rows changed, and once per target to
+        # renew the snapshot loaded at startup. Unchanged listings are not pickled again.
+        if self.__cache is None or self.__listing_filters:
+            return
+
+        changed = set(resource.target for resource in diff.added.values())
+        changed.update(resource.target for resource in diff.removed.values())
+        changed.update(new.target for old, new, fields in diff.changed.values())
+        targets = [target for target in listed if target in changed or target not in self.__saved]
+
+        if not targets:
+            return
+
+        items = {target: [] for target in targets}
+
+        for item in self._items:
+            if item.target in items:
+                items[item.target].append(item)
+
+        for target in targets:
+            self.__cache.save_later(*(self.cache_key(target) + (items[target],)))
+            self.__saved.add(target)
+
+    def targets(self):
+        return aws_top.aws.get_targets()
+
+    @property
+    def columns(self):
+        return (
+            (('account',) if self.multi_account else ()) +
+            (('region',) if self.multi_region else ()) +
+            self.COLUMNS
+        )
+
+    def fetch(self):
+        # generator yielding one list of items per API page, runs on a worker thread
+        raise NotImplementedError
+
+    def fetch_all(self, fetch_pages, filters=None):
+        # fetch_pages is called with an aws.Target for every (account, region) that is shown,
+        # filters are those sent to AWS
+        self.__listing_started = time.time()
+        self.__listing_filters = filters or {}
+
+        return aws_top.aws.fan_out(self.targets(), fetch_pages)
+
+    def add_page(self, page):
+        with aws_top.instrumentation.stats.timed(self.SERVICE + '.update'):
+            self.__add_page(page)
+
+    def __add_page(self, page):
+        if isinstance(page, aws_top.aws.PartialFailure):
+            self.__incoming_failures.append(page)
+            return
+
+        if isinstance(page, aws_top.aws.TargetComplete):
+            # swap in the rows of a finished target without waiting for slower ones
+            if self.__complete:
+                self.__commit(
+                    [item for item in self._items if item.target != page.target] +
+                    [item for item in self.__incoming if item.target == page.target]
+                )
+            return
+
+        self.__incoming.extend(page)
+
+        # until the first refresh completes, show rows as soon as they arrive
+        if not self.__complete:
+            if self._items is None:
+                self._items = []
+
+            self._items.extend(page)
+            self._by_key.update((item.key, item) for item in page)
+            self._table.append_keys(item.key for item in page)
+            self.__visible += len(page)
+            self.__update_table()
+
+    def apply(self, future):
+        with aws_top.instrumentation.stats.timed(self.SERVICE + '.update'):
+            self.__apply(future)
+
+    def __apply(self, future):
+        items, self.__incoming = self.__incoming, []
+        failures, self.__incoming_failures = self.__incoming_failures, []
 
-    def update(self):
         try:
-            self.__instances = aws_top.aws.Ec2().get_all_instances()
-            self.__error = None
-        except botocore.exceptions.ClientError as ex:
-            self.__error = ex.response
-        self._invalidate()
+            future.result()
+        except aws_top.aws.aws_errors() as ex:
+            self._error = str(ex)
+            self.__update_table()
+            return
+
+        # keep the last known rows of targets that failed this time
+        failed = set(failure.target for failure in failures)
+        items.extend(item for item in self._items or [] if item.target in failed)
+
+        self._failures = failures
+        self.stale_since = None
+        diff = self.__commit(items)
+        self.save_listing(diff, [target for target in self.targets() if target not in failed])
+
+        # events received while the listing ran are newer than what it returned
+        self.__changes = [change for change in self.__changes if change[0] >= self.__listing_started]
+
+        for applied_at, resources, removed in self.__changes:
+            self.__commit_changes(resources, removed)
+
+        self.__update_table()
+
+    def resolve_events(self, ids):
+        # Looks up the resources events of aws_top.events are about, ids maps aws.Target to a set
+        # of resource ids. Runs on a worker thread, returns (resources, removed keys). Targets that
+        # are not shown, e.g. other regions of an event bus, are dropped before AWS is called.
+        targets = set(self.targets())
+
+        return self.describe_changes({
+            target: resource_ids for target, resource_ids in ids.items() if target in targets
+        })
+
+    def describe_changes(self, ids):
+        return [], []
+
+    def apply_changes(self, resources, removed=()):
+        # applies the result of resolve_events without waiting for the next listing
+        targets = set(self.targets())
+        resources = [resource for resource in resources if resource.target in targets]
+
+        with aws_top.instrumentation.stats.timed(self.SERVICE + '.update'):
+            self.__changes.append((time.time(), resources, removed))
+
+            if self.__complete:
+                self.__commit_changes(resources, removed)
+
+    def __commit_changes(self, resources, removed):
+        diff = self.__differ.apply(resources, removed)
+
+        if diff:
+            self.__commit_diff(diff, list(self.__differ.snapshot.values()))
+
+    def __commit(self, items):
+        if self.multi_region or self.multi_account:
+            items.sort(key=lambda item: (item.account or '', item.region or ''))
+
+        reordered = [item.key for item in self._items or []] != [item.key for item in items]
+        diff = self.__differ.update(items)
+        self.__commit_diff(diff, items, reordered)
+
+        return diff
+
+    def __commit_diff(self, diff, items, reordered=False):
+        dirty = diff or reordered or self._error or not self.__complete
+
+        # the sort order looks up the values of added and changed resources in the new snapshot
+        self._items = items
+        self._by_key = self.__differ.snapshot
+        self._error = None
+        self.__complete = True
+
+        if self.__texts is not None:
+            self.__texts.update(diff)
+        resorted = self.__sorted.apply(diff) if self.__sorted else False
+
+        if self.__groups:
+            self.__groups.apply(diff)
+            self._table.refresh_rows(GroupKey(group) for group in self.__shown)
+
+        if dirty:
+            self.__patch(diff)
+            self.__update_table(keys_changed=bool(
+                diff.added or diff.removed or resorted or (reordered and not self.__sorted) or
+                (diff.changed and (self.__terms or self.__groups))
+            ))
+
+    def __patch(self, diff):
+        for key in diff.removed:
+            self.__highlights.pop(key, None)
+            self._metrics.remove(key)
+
+        expires = time.time() + self.HIGHLIGHT_SECONDS
+
+        for key, (old, new, fields) in diff.changed.items():
+            self.__highlights[key] = (fields, expires)
+
+        self._table.refresh_rows(diff.changed)
+
+    def __update_table(self, keys_changed=False):
+        if keys_changed:
+            keys = self.visible_keys()
+            self.__visible = len(keys) - len(self.__shown)
+            self._table.set_keys(keys)
+
+        if self._error:
+            self._table.set_message(('error', self._error))
+        elif self._items is None:
+            self._table.set_message(('warn', 'Loading...'))
+        elif len(self._items) == 0:
+            self._table.set_message(('warn', self.empty_text))
+        elif self.__visible == 0:
+            self._table.set_message(('warn', 'No matches for "{}".'.format(' '.join(self.__terms))))
+        else:
+            self._table.set_message(None)
+
+        if self.loading and self._items:
+            self._table.set_footer(('warn', 'Loading more...'))
+        elif self._failures:
+            self._table.set_footer(('error', 'Failed: {}'.format('; '.join(str(f) for f in self._failures))))
+        elif self.stale_since:
+            self._table.set_footer(('warn', 'Cached data from {}s ago, refreshing...'.format(
+                int(time.time() - self.stale_since)
+            )))
+        elif self.__terms:
+            self._table.set_footer(('warn', '{} of {} shown'.format(self.__visible, len(self._items))))
+        else:
+            self._table.set_footer(None)
+
+    def visible_keys(self):
+        # table keys in display order, with a GroupKey before the rows of every group
+        self.__shown = {}
+
+        if not self.__complete:
+            return [item.key for item in self._items]
+
+        # the snapshot is in the order of the items
+        keys = self.__sorted.keys(self.__sort[1]) if self.__sorted else list(self._by_key)
+
+        if self.__terms:
+            matches = self.__texts.search(self.__terms)
+            keys = [key for key in keys if key in matches]
+
+        if not self.__groups:
+            return keys
+
+        members = collections.OrderedDict((group, []) for group in self.__groups.groups())
+
+        for key in keys:
+            members[self.__groups.group(key)].append(key)
+
+        grouped = []
+
+        for group, group_keys in members.items():
+            if not group_keys:
+                continue
+
+            self.__shown[group] = len(group_keys)
+            grouped.append(GroupKey(group))
+
+            if group not in self.__collapsed:
+                grouped.extend(group_keys)
+
+        return grouped
+
+    @property
+    def sort_columns(self):
+        return self.columns[:len(self.columns) - len(self.COLUMNS)] + self.SORT_COLUMNS
+
+    @property
+    def group_fields(self):
+        return self.columns[:len(self.columns) - len(self.COLUMNS)] + self.GROUP_FIELDS
+
+    def sort_value(self, item, column):
+        if column in self.METRIC_COLUMNS:
+            return self.metric(item.key, self.METRIC_COLUMNS[column])
+
+        return getattr(item, column)
+
+    def set_sort(self, column, descending=False):
+        if column is None:
+            self.__sort = self.__sorted = None
+        else:
+            self.__sort = (column, descending)
+            self.__sorted = aws_top.ordering.SortedKeys(
+                lambda key: self.sort_value(self._by_key[key], column),
+                self._by_key if self.__complete else ()
+            )
+
+        self._table.set_header(self.__header())
+
+        if self._items is not None:
+            self.__update_table(keys_changed=True)
+
+    def set_group(self, field):
+        self.__group = field
+        self.__collapsed = set()
+
+        if field is None:
+            self.__groups = None
+        else:
+            self.__groups = aws_top.ordering.GroupCounts(
+                lambda item: getattr(item, field),
+                (lambda item: getattr(item, self.SUMMARY_FIELD)) if self.SUMMARY_FIELD else None,
+                self._by_key.items() if self.__complete else ()
+            )
+
+        if self._items is not None:
+            self.__update_table(keys_changed=True)
+
+    def toggle_group(self, group):
+        self.__collapsed.symmetric_difference_update([group])
+        self._table.refresh_rows([GroupKey(group)])
+        self.__update_table(keys_changed=True)
+
+    def keypress(self, size, key):
+        key = super(ServiceWindow, self).keypress(size, key)
+
+        if key == 's' and self.sort_columns:
+            self.set_sort(_next(self.sort_columns, self.__sort[0] if self.__sort else None))
+        elif key == 'S' and self.__sort:
+            self.set_sort(self.__sort[0], not self.__sort[1])
+        elif key == 'g' and self.group_fields:
+            self.set_group(_next(self.group_fields, self.__group))
+        elif key in ('enter', ' ') and isinstance(self._table.selected_key, GroupKey):
+            self.toggle_group(self._table.selected_key.value)
+        else:
+            return key
+
+        return None
+
+    def search_text(self, item):
+        return ' '.join(str(value) for value in (item.account, item.region) + item.values() if value is not None)
+
+    def set_query(self, text, apply_filters=False):
+        # Free-text terms narrow the table right away. Prefixed filters are only sent to AWS when
+        # applied, returns True if they changed and the window has to be fetched again.
+        filters, terms = aws_top.search.parse_query(text, self.FILTERS)
+
+        if terms != self.__terms:
+            self.__terms = terms
+
+            if not terms:
+                self.__texts = None
+            elif self.__texts is None:
+                self.__texts = aws_top.search.SearchTexts(self.search_text)
+
+                for key, item in self._by_key.items():
+                    self.__texts.add(key, item)
+
+            if self._items is not None:
+                self.__update_table(keys_changed=True)
+
+        if apply_filters and filters != self.filters:
+            self.filters = filters
+            return True
+
+        return False
+
+    def tick(self, now=None):
+        now = now or time.time()
+        expired = [key for key, (fields, expires) in self.__highlights.items() if expires <= now]
+
+        for key in expired:
+            del self.__highlights[key]
+
+        self._table.refresh_rows(expired)
+
+        if self.stale_since:
+            self.__update_table()
+
+    def metric_targets(self):
+        return list(self._items or [])
+
+    def metrics_job(self, now=None):
+        # returns a callable for the refresh engine if CloudWatch metrics should be fetched
+        now = now or time.time()
+
+        if not self.METRICS or now - self.__metrics_requested < self.METRICS_INTERVAL:
+            return None
+
+        targets = self.metric_targets()
+
+        if not targets:
+            return None
+
+        self.__metrics_requested = now
+
+        # CloudWatch is regional, so resources are grouped per target and mapped back to their keys
+        groups = {}
 
-    def rows(self, size, focus=False):
-        return 1 + max(len(self.__instances), 1)
+        for item in targets:
+            groups.setdefault(item.target, {})[item.metric_id] = item.key
+
+        return lambda: self.__fetch_metrics(groups)
+
+    def __fetch_metrics(self, groups):
+        datapoints = {}
+
+        for target, keys in groups.items():
+            fetcher = self.__metrics_fetchers.get(target)
+
+            if fetcher is None:
+                fetcher = self.__metrics_fetchers[target] = aws_top.aws.MetricsFetcher(
+                    self.METRICS_NAMESPACE,
+                    self.METRICS_DIMENSION,
+                    target.region,
+                    self.METRICS_PERIOD,
+                    account=target.account
+                )
+
+            for (metric_id, metric), points in fetcher.fetch(list(keys), self.METRICS).items():
+                datapoints[(keys[metric_id], metric)] = points
+
+        return datapoints
+
+    def apply_metrics(self, future):
+        try:
+            datapoints = future.result()
+        except aws_top.aws.aws_errors():
+            # metrics are optional, keep showing the last known values
+            return
+
+        changed = set()
+
+        for (key, metric), points in datapoints.items():
+            if key in self._by_key and self._metrics.add(key, metric, points):
+                changed.add(key)
+
+        self._table.refresh_rows(changed)
+
+        # sorted by a metric column
+        if self.__sorted and self.__sorted.update(changed):
+            self.__update_table(keys_changed=True)
+
+    def metric(self, key, metric):
+        return self._metrics.latest(key, metric)
+
+    def sparkline(self, key, metric, maximum=None):
+        return WindowManager.sparkline(self._metrics.series(key, metric), maximum)
+
+    def __build_group_row(self, key):
+        group = key.value
+        shown = self.__shown.get(group, 0)
+        total = self.__groups.count(group) if group in self.__groups.groups() else 0
+        summary = ', '.join('{} {}'.format(value, count) for value, count in self.__groups.summary(group))
+
+        return urwid.AttrMap(TableRow([urwid.Text('{} {}: {}  {}{}{}'.format(
+            '\u25b6' if group in self.__collapsed else '\u25bc',
+            self.__group,
+            'N/A' if group is None else group,
+            shown if shown == total else '{} of {}'.format(shown, total),
+            ' ' if summary else '',
+            '({})'.format(summary) if summary else ''
+        ), wrap=urwid.CLIP)]), 'bold', focus_map='selected')
+
+    def __build_row(self, key):
+        if isinstance(key, GroupKey):
+            return self.__build_group_row(key)
+
+        item = self._by_key[key]
+        cells = self.render_item(item)
+        highlighted = self.__highlights.get(key, (frozenset(), None))[0]
+
+        if self.multi_region:
+            cells.insert(0, urwid.Text(item.region))
+
+        if self.multi_account:
+            cells.insert(0, urwid.Text(item.account))
+
+        for i, field in enumerate(self.columns):
+            # one line per row, long names are cut at the column border
+            cells[i].set_wrap_mode(urwid.CLIP)
+
+            if field in highlighted:
+                cells[i] = urwid.AttrMap(cells[i], 'changed')
+
+        return urwid.AttrMap(TableRow(self.__sized(cells), dividechars=1), None, focus_map='selected')
 
     def render(self, size, focus=False):
-        if self.__error:
-            return urwid.Text(('error', self.__error), align=urwid.CENTER).render(size)
+        with aws_top.instrumentation.stats.timed(self.SERVICE + '.render'):
+            return super(ServiceWindow, self).render(size, focus)
 
-        body = []
-        header = [
+    @property
+    def selected(self):
+        return self._by_key.get(self._table.selected_key)
+
+    @property
+    def failures(self):
+        # aws.PartialFailure of every target the last listing could not fetch
+        return self._failures
+
+    @property
+    def loading(self):
+        return not self.__complete and self._error is None
+
+    @property
+    def transitioning(self):
+        return False
+
+    def render_header(self):
+        raise NotImplementedError
+
+    def render_item(self, item):
+        raise NotImplementedError
+
+
+class Ec2Window(ServiceWindow):
+    empty_text = 'No available EC2 instances in this region.'
+    SERVICE = 'ec2'
+    COLUMNS = ('id', 'name', 'state', 'instance_type', 'az', 'cpu', 'cpu_history', 'network_in', 'network_out')
+    METRICS_NAMESPACE = 'AWS/EC2'
+    METRICS_DIMENSION = 'InstanceId'
+    METRICS = {
+        'CPUUtilization': 'Average',
+        'NetworkIn': 'Average',
+        'NetworkOut': 'Average'
+    }
+    TRANSITIONAL_STATES = frozenset(['pending', 'stopping', 'shutting-down'])
+    FILTERS = tuple(aws_top.aws.Ec2.FILTERS)
+    SORT_COLUMNS = ('id', 'name', 'state', 'instance_type', 'az', 'cpu', 'network_in', 'network_out')
+    GROUP_FIELDS = ('az', 'state', 'instance_type')
+    SUMMARY_FIELD = 'state'
+    METRIC_COLUMNS = {
+        'cpu': 'CPUUtilization',
+        'network_in': 'NetworkIn',
+        'network_out': 'NetworkOut'
+    }
+    COLUMN_WIDTHS = {
+        'id': 19,
+        'cpu': 6,
+        'network_in': 8,
+        'network_out': 8
+    }
+    HISTORY_COLUMNS = ('cpu_history',)
+
+    @property
+    def transitioning(self):
+        return any(instance.state in self.TRANSITIONAL_STATES for instance in self._items or [])
+
+    def fetch(self):
+        # the filter bar may change while the listing runs
+        applied = dict(self.filters)
+        filters = aws_top.aws.Ec2.build_filters(applied)
+
+        return self.fetch_all(
+            lambda target: aws_top.aws.Ec2(target.region, target.account, filters).iter_instance_pages(),
+            applied
+        )
+
+    def describe_changes(self, ids):
+        # instances are described again, those gone or not matching the filters anymore are removed
+        filters = aws_top.aws.Ec2.build_filters(self.filters)
+        resources, removed = [], []
+
+        for target, instance_ids in ids.items():
+            instances = aws_top.aws.Ec2(target.region, target.account, filters).get_instances(instance_ids)
+            found = set(instance.id for instance in instances)
+            resources.extend(instances)
+            removed.extend((target.account, target.region, instance_id) for instance_id in instance_ids - found)
+
+        return resources, removed
+
+    def render_header(self):
+        return [
             urwid.Text('ID'),
             urwid.Text('Name', align=urwid.LEFT),
             urwid.Text('State', align=urwid.LEFT),
             urwid.Text('Type', align=urwid.LEFT),
-            urwid.Text('AZ', align=urwid.LEFT)
+            urwid.Text('AZ', align=urwid.LEFT),
+            urwid.Text('CPU', align=urwid.RIGHT),
+            urwid.Text('CPU History', align=urwid.LEFT),
+            urwid.Text('Net In', align=urwid.RIGHT),
+            urwid.Text('Net Out', align=urwid.RIGHT)
         ]
 
-        body.append(
-            urwid.AttrMap(urwid.Columns(header), 'bold')
-        )
+    def metric_targets(self):
+        return [instance for instance in self._items or [] if instance.state == 'running']
+
+    def render_item(self, instance):
+        return [
+            urwid.Text(instance.id),
+            urwid.Text(instance.name or 'N/A'),
+            urwid.Text(instance.state),
+            urwid.Text(instance.instance_type),
+            urwid.Text(instance.az),
+            urwid.Text(_format_percent(self.metric(instance.key, 'CPUUtilization')), align=urwid.RIGHT),
+            urwid.Text(self.sparkline(instance.key, 'CPUUtilization', 100), wrap=urwid.CLIP),
+            urwid.Text(_format_bytes(self.metric(instance.key, 'NetworkIn')), align=urwid.RIGHT),
+            urwid.Text(_format_bytes(self.metric(instance.key, 'NetworkOut')), align=urwid.RIGHT)
+        ]
 
-        if len(self.__instances) == 0:
-            body.append(urwid.Text(('warn', 'No available EC2 instances in this region.'), align=urwid.CENTER))
 
-        for i, instance in enumerate(self.__instances, 1):
-            body.append(
-                urwid.Columns(
-                    [
-                        urwid.Text(instance.id),
-                        urwid.Text(instance.name or 'N/A'),
-                        urwid.Text(instance.state),
-                        urwid.Text(instance.instance_type),
-                        urwid.Text(instance.az)
-                    ]
-                )
-            )
+class S3Window(ServiceWindow):
+    empty_text = 'No available S3 buckets.'
+    COLUMNS = ('name', 'location', 'size', 'objects', 'creation_date')
+    SORT_COLUMNS = ('name', 'location', 'size', 'objects', 'creation_date')
+    GROUP_FIELDS = ('location',)
+    METRIC_COLUMNS = {
+        'size': 'BucketSizeBytes',
+        'objects': 'NumberOfObjects'
+    }
+    # new buckets get their size after a few minutes, known ones are served from the cache of aws.S3
+    METRICS_INTERVAL = 5 * 60
+    SERVICE = 's3'
+    REGIONAL = False
+    __metrics_requested = 0
 
-        return urwid.Pile(body).render(size)
+    def targets(self):
+        return aws_top.aws.get_account_targets()
 
+    def fetch(self):
+        return self.fetch_all(lambda target: self.__fetch_buckets(target.account))
 
-class S3Window(urwid.Widget):
-    _sizing = frozenset([urwid.FLOW])
+    @staticmethod
+    def __fetch_buckets(account):
+        yield aws_top.aws.S3(account).get_all_buckets()
 
-    def __init__(self):
-        self.__buckets = []
-        self.__error = None
-        self.update()
+    def metrics_job(self, now=None):
+        # the daily storage metrics are in the region of each bucket, so only located buckets are sized
+        now = now or time.time()
 
-    def update(self):
-        try:
-            self.__buckets = aws_top.aws.S3().get_all_buckets()
-            self.__error = None
-        except botocore.exceptions.ClientError as ex:
-            self.__error = ex.response
-        self._invalidate()
+        if now - self.__metrics_requested < self.METRICS_INTERVAL:
+            return None
 
-    def rows(self, size, focus=False):
-        return 1 + max(len(self.__buckets), 1)
+        buckets = [bucket for bucket in self._items or [] if bucket.location]
 
-    def render(self, size, focus=False):
-        if self.__error:
-            return urwid.Text(('error', self.__error), align=urwid.CENTER).render(size)
+        if not buckets:
+            return None
 
-        body = []
+        self.__metrics_requested = now
+
+        return lambda: aws_top.aws.S3.get_bucket_metrics(buckets)
 
-        header = [
+    def render_header(self):
+        return [
             urwid.Text('Name'),
+            urwid.Text('Region', align=urwid.LEFT),
+            urwid.Text('Size', align=urwid.LEFT),
+            urwid.Text('Objects', align=urwid.LEFT),
             urwid.Text('Creation Date', align=urwid.LEFT),
         ]
 
-        body.append(
-            urwid.AttrMap(urwid.Columns(header), 'bold')
-        )
+    def render_item(self, bucket):
+        objects = self.metric(bucket.key, 'NumberOfObjects')
 
-        if len(self.__buckets) == 0:
-            body.append(urwid.Text(('warn', 'No available S3 buckets.'), align=urwid.CENTER))
-
-        for i, bucket in enumerate(self.__buckets, 1):
-            body.append(
-                urwid.Columns(
-                    [
-                        urwid.Text(bucket.name),
-                        urwid.Text(bucket.creation_date.strftime("%Y-%m-%d %H:%M:%S"))
-                    ]
-                )
-            )
+        return [
+            urwid.Text(bucket.name),
+            urwid.Text(bucket.location or '-'),
+            urwid.Text(_format_bytes(self.metric(bucket.key, 'BucketSizeBytes'))),
+            urwid.Text('-' if objects is None else '{:,.0f}'.format(objects)),
+            urwid.Text(bucket.creation_date.strftime("%Y-%m-%d %H:%M:%S"))
+        ]
 
-        return urwid.Pile(body).render(size)
 
+class LambdaWindow(ServiceWindow):
+    empty_text = 'No available Lambda functions in this region.'
+    SERVICE = 'lambda'
+    COLUMNS = ('name', 'runtime', 'code_size', 'memory_size', 'timeout', 'last_modified', 'invocations')
+    METRICS_NAMESPACE = 'AWS/Lambda'
+    METRICS_DIMENSION = 'FunctionName'
+    METRICS = {
+        'Invocations': 'Sum'
+    }
+    SORT_COLUMNS = ('name', 'runtime', 'code_size', 'memory_size', 'timeout', 'last_modified', 'invocations')
+    GROUP_FIELDS = ('runtime', 'memory_size', 'timeout')
+    METRIC_COLUMNS = {
+        'invocations': 'Invocations'
+    }
+    HISTORY_COLUMNS = ('invocations',)
 
-class LambdaWindow(urwid.Widget):
-    _sizing = frozenset([urwid.FLOW])
+    def fetch(self):
+        return self.fetch_all(lambda target: aws_top.aws.Lambda(target.region, target.account).iter_function_pages())
 
-    def __init__(self):
-        self.__functions = []
-        self.__error = None
-        self.update()
+    def describe_changes(self, ids):
+        resources, removed = [], []
 
-    def update(self):
-        try:
-            self.__functions = aws_top.aws.Lambda().get_all_functions()
-            self.__error = None
-        except botocore.exceptions.ClientError as ex:
-            self.__error = ex.response
-        self._invalidate()
+        for target, names in ids.items():
+            functions = aws_top.aws.Lambda(target.region, target.account)
 
-    def rows(self, size, focus=False):
-        return 1 + max(len(self.__functions), 1)
+            for name in names:
+                func = functions.get_function(name)
 
-    def render(self, size, focus=False):
-        if self.__error:
-            return urwid.Text(('error', self.__error), align=urwid.CENTER).render(size)
+                if func is None:
+                    removed.append((target.account, target.region, name))
+                else:
+                    resources.append(func)
 
-        body = []
+        return resources, removed
 
-        header = [
+    def render_header(self):
+        return [
             urwid.Text('Name'),
             urwid.Text('Runtime', align=urwid.LEFT),
             urwid.Text('Size', align=urwid.LEFT),
             urwid.Text('Memory', align=urwid.LEFT),
             urwid.Text('Timeout', align=urwid.LEFT),
             urwid.Text('Last Modified', align=urwid.LEFT),
+            urwid.Text('Invocations', align=urwid.LEFT),
         ]
 
-        body.append(
-            urwid.AttrMap(urwid.Columns(header), 'bold')
-        )
+    def render_item(self, func):
+        return [
+            urwid.Text(func.name),
+            urwid.Text(func.runtime or 'N/A'),
+            urwid.Text(_format_bytes(func.code_size)),
+            urwid.Text('{} MB'.format(func.memory_size)),
+            urwid.Text('{}s'.format(func.timeout)),
+            urwid.Text(_format_timestamp(func.last_modified)),
+            urwid.Text(self.sparkline(func.key, 'Invocations'), wrap=urwid.CLIP)
+        ]
 
-        if len(self.__functions) == 0:
-            body.append(urwid.Text(('warn', 'No available Lambda functions in this region.'), align=urwid.CENTER))
 
-        for i, func in enumerate(self.__functions, 1):
-            body.append(
-                urwid.Columns(
-                    [
-                        urwid.Text(func.name),
-                        urwid.Text(func.runtime),
-                        urwid.Text(func.code_size),
-                        urwid.Text(func.memory_size),
-                        urwid.Text(func.timeout),
-                        urwid.Text(func.last_modified)
-                    ]
-                )
-            )
+class DynamoDbWindow(ServiceWindow):
+    empty_text = 'No available DynamoDB tables in this region.'
+    SERVICE = 'dynamodb'
+    COLUMNS = ('name', 'status', 'item_count', 'size', 'billing_mode', 'read', 'write')
+    METRICS_NAMESPACE = 'AWS/DynamoDB'
+    METRICS_DIMENSION = 'TableName'
+    METRICS = {
+        'ConsumedReadCapacityUnits': 'Sum',
+        'ConsumedWriteCapacityUnits': 'Sum'
+    }
+    SORT_COLUMNS = ('name', 'status', 'item_count', 'size', 'billing_mode', 'read', 'write')
+    GROUP_FIELDS = ('billing_mode', 'status')
+    SUMMARY_FIELD = 'status'
+    METRIC_COLUMNS = {
+        'read': 'ConsumedReadCapacityUnits',
+        'write': 'ConsumedWriteCapacityUnits'
+    }
+
+    def fetch(self):
+        return self.fetch_all(lambda target: aws_top.aws.DynamoDb(target.region, target.account).iter_table_pages())
+
+    def render_header(self):
+        return [
+            urwid.Text('Name'),
+            urwid.Text('Status', align=urwid.LEFT),
+            urwid.Text('Items', align=urwid.LEFT),
+            urwid.Text('Size', align=urwid.LEFT),
+            urwid.Text('Billing', align=urwid.LEFT),
+            urwid.Text('Read/s', align=urwid.LEFT),
+            urwid.Text('Write/s', align=urwid.LEFT),
+        ]
 
-        return urwid.Pile(body).render(size)
+    def render_item(self, table):
+        return [
+            urwid.Text(table.name),
+            urwid.Text(table.status),
+            urwid.Text('-' if table.item_count is None else '{:,}'.format(table.item_count)),
+            urwid.Text(_format_bytes(table.size)),
+            urwid.Text(table.billing_mode.replace('_', ' ').lower()),
+            urwid.Text(self.__capacity(table.key, 'ConsumedReadCapacityUnits', table.read_capacity)),
+            urwid.Text(self.__capacity(table.key, 'ConsumedWriteCapacityUnits', table.write_capacity))
+        ]
+
+    def __capacity(self, key, metric, provisioned):
+        # consumed units are summed per period, shown per second next to the provisioned units
+        consumed = self.metric(key, metric)
+        consumed = '-' if consumed is None else '{:.1f}'.format(consumed / self.METRICS_PERIOD)
+
+        return consumed if provisioned is None else '{}/{}'.format(consumed, provisioned)
+
+
+def _format_timestamp(value):
+    # 2018-01-01T12:00:00.000+0000 -> 2018-01-01 12:00:00
+    return value[:19].replace('T', ' ')
+
+
+def _format_percent(value):
+    return '-' if value is None else '{:.1f}%'.format(value)
+
+
+def _format_bytes(value):
+    if value is None:
+        return '-'
+
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if abs(value) < 1024:
+            return '{:.0f}{}'.format(value, unit) if unit == 'B' else '{:.1f}{}'.format(value, unit)
+        value /= 1024.0
+
+    return '{:.1f}TB'.format(value)
+
+
+def _next(values, current):
+    # cycles through values and then back to None
+    if current is None:
+        return values[0]
+
+    i = values.index(current) + 1
+
+    return values[i] if i < len(values) else None
+
+
+class FilterBar(urwid.Edit):
+    # Emits QUERY_CHANGE on every keystroke and QUERY_APPLY on enter. Escape clears the query.
+    signals = ['change', 'postchange', aws_top.signals.QUERY_CHANGE, aws_top.signals.QUERY_APPLY]
+
+    def __init__(self):
+        super(FilterBar, self).__init__(('bold', 'Filter: '))
+
+    def keypress(self, size, key):
+        if key == 'enter':
+            self._emit(aws_top.signals.QUERY_APPLY, self.edit_text)
+            return None
+
+        if key == 'esc':
+            self.set_edit_text('')
+            self._emit(aws_top.signals.QUERY_APPLY, '')
+            return None
+
+        text = self.edit_text
+        key = super(FilterBar, self).keypress(size, key)
+
+        if self.edit_text != text:
+            self._emit(aws_top.signals.QUERY_CHANGE, self.edit_text)
+
+        return key
 
 
 class OptionWindow(urwid.Widget):
@@ -233,7 +1056,8 @@ class OptionWindow(urwid.Widget):
                     [
                         ('f_key', "F" + str(i)),
                         ('options_bg', option.text)
-                    ]
+                    ],
+                    wrap=urwid.CLIP
                 )
             )
 
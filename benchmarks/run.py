@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+import argparse
+import collections
+import concurrent.futures
+import gc
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+# fake credentials keep botocore from looking for real ones, no request leaves the process
+os.environ.setdefault('AWS_DEFAULT_REGION', 'eu-west-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'benchmark')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'benchmark')
+
+import aws_top.aws
+import aws_top.window
+from benchmarks import synthetic
+
+DEFAULT_SIZES = (100, 10000, 100000)
+RENDER_SIZE = (200, 50)
+CHURN = 0.01
+
+Service = collections.namedtuple('Service', ['generate', 'pages', 'fetch', 'parse', 'change', 'window'])
+
+SERVICES = collections.OrderedDict([
+    ('ec2', Service(
+        synthetic.instances,
+        synthetic.ec2_pages,
+        lambda: aws_top.aws.Ec2().get_all_instances(),
+        lambda raw, region: [aws_top.aws.Ec2Instance.from_dict(item, region) for item in raw],
+        lambda item: dict(item, State={'Name': 'stopping', 'Code': 64}),
+        aws_top.window.Ec2Window
+    )),
+    ('lambda', Service(
+        synthetic.functions,
+        synthetic.lambda_pages,
+        lambda: aws_top.aws.Lambda().get_all_functions(),
+        lambda raw, region: [aws_top.aws.LambdaFunction.from_dict(item, region) for item in raw],
+        lambda item: dict(item, MemorySize=item['MemorySize'] * 2),
+        aws_top.window.LambdaWindow
+    )),
+    ('s3', Service(
+        synthetic.buckets,
+        synthetic.s3_pages,
+        lambda: aws_top.aws.S3().get_all_buckets(),
+        lambda raw, region: [aws_top.aws.S3Bucket.from_dict(item) for item in raw],
+        lambda item: dict(item, CreationDate=item['CreationDate'].replace(year=2019)),
+        aws_top.window.S3Window
+    )),
+])
+
+
+def measure(func, setup=None, repeat=3):
+    # best wall time of repeat runs, plus the peak of traced allocations in one extra run
+    timings = []
+
+    for _ in range(repeat):
+        if setup:
+            setup()
+
+        gc.collect()
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+
+    if setup:
+        setup()
+
+    gc.collect()
+    tracemalloc.start()
+
+    try:
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {'seconds': min(timings), 'peak_mb': peak / (1024 * 1024)}
+
+
+def load_window(window_class, items, page_size=1000):
+    window = window_class()
+
+    for page in synthetic.chunks(items, page_size):
+        window.add_page(page)
+
+    return apply_and_render(window)
+
+
+def apply_and_render(window):
+    done = concurrent.futures.Future()
+    done.set_result(None)
+    window.apply(done)
+    window.render(RENDER_SIZE, focus=True)
+
+    return window
+
+
+def update_window(window, items):
+    window.add_page(items)
+    apply_and_render(window)
+
+
+def run_service(name, service, size, repeat):
+    churn = max(int(size * CHURN), 1)
+    generated = list(service.generate(size + churn))
+    raw = generated[:size]
+
+    # the next listing drops and adds churn items and changes every 100th one
+    raw_next = [service.change(item) if i % 100 == 0 else item for i, item in enumerate(generated[churn:])]
+
+    region = aws_top.aws.get_region()
+    client = aws_top.aws.clients.client(name)
+    backend = synthetic.SyntheticBackend(client, name, service.pages(raw))
+    results = collections.OrderedDict()
+
+    try:
+        results['fetch'] = measure(service.fetch, backend.queue, repeat)
+    finally:
+        backend.deactivate()
+
+    results['parse'] = measure(lambda: service.parse(raw, region), repeat=repeat)
+
+    items = service.parse(raw, region)
+    items_next = service.parse(raw_next, region)
+
+    def diff():
+        differ = aws_top.aws.SnapshotDiffer()
+        differ.update(items)
+        return differ.update(items_next)
+
+    results['diff'] = measure(diff, repeat=repeat)
+    results['render'] = measure(lambda: load_window(service.window, items), repeat=repeat)
+
+    windows = []
+    results['render_update'] = measure(
+        lambda: update_window(windows[-1], items_next),
+        lambda: windows.append(load_window(service.window, items)),
+        repeat
+    )
+
+    return collections.OrderedDict(
+        ('{}.{}.{}'.format(name, phase, size), result) for phase, result in results.items()
+    )
+
+
+def compare(results, baseline, threshold):
+    # prints the relative change of every benchmark and returns the names of the regressed ones
+    regressions = []
+
+    print('{:<28} {:>10} {:>10} {:>8} {:>10} {:>10} {:>8}'.format(
+        'benchmark', 'base s', 'now s', 'change', 'base MB', 'now MB', 'change'
+    ))
+
+    for name, result in results.items():
+        before = baseline.get(name)
+
+        if before is None:
+            continue
+
+        changes = []
+
+        for metric in ('seconds', 'peak_mb'):
+            change = result[metric] / before[metric] - 1 if before[metric] else 0.0
+            changes.append(change)
+
+            if change > threshold:
+                regressions.append('{} {}'.format(name, metric))
+
+        print('{:<28} {:>10.4f} {:>10.4f} {:>+7.0%} {:>10.2f} {:>10.2f} {:>+7.0%}'.format(
+            name, before['seconds'], result['seconds'], changes[0], before['peak_mb'], result['peak_mb'], changes[1]
+        ))
+
+    return regressions
+
+
+def main():
+    argparser = argparse.ArgumentParser(description='aws-top benchmarks against a synthetic AWS backend')
+    argparser.add_argument('--sizes', type=lambda value: [int(size) for size in value.split(',')],
+                           default=list(DEFAULT_SIZES), help='comma separated numbers of resources')
+    argparser.add_argument('--services', type=lambda value: value.split(','), default=list(SERVICES),
+                           help='comma separated services (default: {})'.format(','.join(SERVICES)))
+    argparser.add_argument('--repeat', type=int, default=3, help='runs per benchmark, the fastest counts')
+    argparser.add_argument('-o', '--output', help='write the results to this JSON file')
+    argparser.add_argument('-b', '--baseline', help='compare against results written by an earlier run')
+    argparser.add_argument('--threshold', type=float, default=0.1,
+                           help='relative slowdown or memory growth reported as regression (default: 0.1)')
+
+    args = argparser.parse_args()
+    results = collections.OrderedDict()
+
+    for name in args.services:
+        for size in args.sizes:
+            for benchmark, result in run_service(name, SERVICES[name], size, args.repeat).items():
+                results[benchmark] = result
+                print('{:<28} {:>10.4f} s {:>10.2f} MB'.format(benchmark, result['seconds'], result['peak_mb']),
+                      file=sys.stderr)
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump({
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'results': results
+            }, output, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            regressions = compare(results, json.load(baseline)['results'], args.threshold)
+
+        if regressions:
+            print('Regressions: {}'.format(', '.join(regressions)))
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+import datetime
+import random
+
+from botocore.stub import Stubber
+
+INSTANCE_TYPES = ('t3.micro', 't3.large', 'm5.xlarge', 'c5.2xlarge', 'r5.large')
+INSTANCE_STATES = (('running', 16), ('stopped', 80), ('pending', 0), ('stopping', 64))
+RUNTIMES = ('python3.6', 'nodejs8.10', 'java8', 'go1.x')
+REGIONS = ('us-east-1', 'eu-west-1', 'eu-central-1', 'ap-southeast-2')
+
+# page sizes of the real APIs
+EC2_PAGE_SIZE = 1000
+LAMBDA_PAGE_SIZE = 50
+
+
+def instances(count, region='eu-west-1', seed=0):
+    rng = random.Random(seed)
+
+    for i in range(count):
+        state, code = INSTANCE_STATES[0] if rng.random() < 0.8 else rng.choice(INSTANCE_STATES)
+        yield {
+            'InstanceId': 'i-{:017x}'.format(i),
+            'InstanceType': rng.choice(INSTANCE_TYPES),
+            'State': {'Name': state, 'Code': code},
+            'Placement': {'AvailabilityZone': region + rng.choice('abc')},
+            'Tags': [{'Key': 'Name', 'Value': 'instance-{}'.format(i)}, {'Key': 'team', 'Value': rng.choice('xyz')}]
+        }
+
+
+def functions(count, seed=0):
+    rng = random.Random(seed)
+    modified = datetime.datetime(2018, 1, 1, tzinfo=datetime.timezone.utc)
+
+    for i in range(count):
+        yield {
+            'FunctionName': 'function-{}'.format(i),
+            'Runtime': rng.choice(RUNTIMES),
+            'CodeSize': rng.randint(1024, 50 * 1024 * 1024),
+            'MemorySize': rng.choice((128, 256, 512, 1024)),
+            'Timeout': rng.choice((3, 30, 300)),
+            'LastModified': (modified + datetime.timedelta(minutes=i)).strftime('%Y-%m-%dT%H:%M:%S.000+0000')
+        }
+
+
+def buckets(count):
+    created = datetime.datetime(2018, 1, 1, tzinfo=datetime.timezone.utc)
+
+    for i in range(count):
+        yield {
+            'Name': 'bucket-{}'.format(i),
+            'CreationDate': created + datetime.timedelta(minutes=i),
+            'BucketRegion': REGIONS[i % len(REGIONS)]
+        }
+
+
+def chunks(items, size):
+    items = list(items)
+    return [items[i:i + size] for i in range(0, len(items), size)] or [[]]
+
+
+def ec2_pages(raw_instances):
+    pages = []
+    chunked = chunks(raw_instances, EC2_PAGE_SIZE)
+
+    for i, chunk in enumerate(chunked):
+        page = {'Reservations': [{'ReservationId': 'r-{}'.format(i), 'Instances': chunk}]}
+
+        if i + 1 < len(chunked):
+            page['NextToken'] = str(i + 1)
+
+        pages.append(page)
+
+    return pages
+
+
+def lambda_pages(raw_functions):
+    pages = []
+    chunked = chunks(raw_functions, LAMBDA_PAGE_SIZE)
+
+    for i, chunk in enumerate(chunked):
+        page = {'Functions': chunk}
+
+        if i + 1 < len(chunked):
+            page['NextMarker'] = str(i + 1)
+
+        pages.append(page)
+
+    return pages
+
+
+def s3_pages(raw_buckets):
+    return [{'Buckets': list(raw_buckets), 'Owner': {'ID': 'owner'}}]
+
+
+class SyntheticBackend:
+    # Answers the listing calls of aws_top.aws clients from generated pages instead of AWS.
+    # Responses are queued again before every fetch, since the stubber consumes them.
+
+    OPERATIONS = {
+        'ec2': 'describe_instances',
+        'lambda': 'list_functions',
+        's3': 'list_buckets',
+    }
+
+    def __init__(self, client, service, pages):
+        self.__stubber = Stubber(client)
+        self.__operation = self.OPERATIONS[service]
+        self.__pages = pages
+        self.__stubber.activate()
+
+    def queue(self):
+        for page in self.__pages:
+            self.__stubber.add_response(self.__operation, page)
+
+    def deactivate(self):
+        self.__stubber.deactivate()
@@ -0,0 +1,183 @@
+import concurrent.futures
+import json
+import os
+import unittest
+from unittest import mock
+
+from botocore.stub import Stubber
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'eu-west-1')
+
+from aws_top import aws, events
+from aws_top.accounts import Account
+from aws_top.window import Ec2Window
+
+QUEUE_URL = 'https://sqs.eu-west-1.amazonaws.com/111111111111/aws-top'
+
+
+def ec2_event(instance_id, account='111111111111', region='eu-west-1'):
+    return {
+        'source': 'aws.ec2',
+        'account': account,
+        'region': region,
+        'detail-type': 'EC2 Instance State-change Notification',
+        'detail': {'instance-id': instance_id, 'state': 'stopped'}
+    }
+
+
+def lambda_event(event_name, function_name, account='111111111111', region='eu-west-1'):
+    return {
+        'source': 'aws.lambda',
+        'account': account,
+        'region': region,
+        'detail-type': 'AWS API Call via CloudTrail',
+        'detail': {'eventName': event_name, 'requestParameters': {'functionName': function_name}}
+    }
+
+
+def instance(instance_id, state='running', region='eu-west-1', account=None):
+    return aws.Ec2Instance(instance_id, state, 't3.micro', region + 'a', None, region, account)
+
+
+class EventsTestCase(unittest.TestCase):
+    def setUp(self):
+        aws.set_accounts([])
+        aws.set_region('eu-west-1')
+        patcher = mock.patch.object(aws, 'get_default_account_id', return_value='111111111111')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(aws.set_accounts, [])
+
+
+class ParseMessageTest(EventsTestCase):
+    def test_ec2_event(self):
+        self.assertEqual(
+            events.parse_message(json.dumps(ec2_event('i-1'))),
+            ('EC2', aws.Target(None, 'eu-west-1'), 'i-1')
+        )
+
+    def test_sns_notification(self):
+        body = json.dumps({'Type': 'Notification', 'Message': json.dumps(ec2_event('i-1'))})
+
+        self.assertEqual(events.parse_message(body), ('EC2', aws.Target(None, 'eu-west-1'), 'i-1'))
+
+    def test_lambda_event_with_arn(self):
+        body = json.dumps(lambda_event(
+            'UpdateFunctionConfiguration20150331v2', 'arn:aws:lambda:eu-west-1:111111111111:function:api'
+        ))
+
+        self.assertEqual(events.parse_message(body), ('Lambda', aws.Target(None, 'eu-west-1'), 'api'))
+
+    def test_other_lambda_calls_are_ignored(self):
+        self.assertIsNone(events.parse_message(json.dumps(lambda_event('Invoke', 'api'))))
+
+    def test_event_of_other_account_is_dropped(self):
+        self.assertIsNone(events.parse_message(json.dumps(ec2_event('i-1', account='999999999999'))))
+
+    def test_accounts_are_matched_by_id(self):
+        aws.set_accounts([
+            Account('prod', None, account_id='111111111111'),
+            Account('dev', None, account_id='222222222222')
+        ])
+
+        self.assertEqual(
+            events.parse_message(json.dumps(ec2_event('i-1', account='222222222222'))),
+            ('EC2', aws.Target('dev', 'eu-west-1'), 'i-1')
+        )
+        self.assertIsNone(events.parse_message(json.dumps(ec2_event('i-1', account='999999999999'))))
+
+    def test_malformed_messages(self):
+        for body in ('not json', '[]', json.dumps({'source': 'aws.lambda', 'account': '111111111111',
+                                                  'detail': {'eventName': None}})):
+            self.assertIsNone(events.parse_message(body))
+
+
+class EventQueueTest(EventsTestCase):
+    def message(self, i, event):
+        return {'MessageId': str(i), 'ReceiptHandle': 'handle-{}'.format(i), 'Body': json.dumps(event)}
+
+    def test_receive_drains_the_queue(self):
+        queue = events.EventQueue(QUEUE_URL)
+        client = aws.clients.client('sqs', 'eu-west-1')
+        first = [self.message(i, ec2_event('i-{}'.format(i % 3))) for i in range(10)]
+        second = [self.message(10, lambda_event('DeleteFunction20150331', 'api')), self.message(11, {'foo': 1})]
+
+        with Stubber(client) as stubber:
+            for batch, wait_seconds in ((first, 20), (second, 0)):
+                stubber.add_response(
+                    'receive_message', {'Messages': batch},
+                    {'QueueUrl': QUEUE_URL, 'MaxNumberOfMessages': 10, 'WaitTimeSeconds': wait_seconds}
+                )
+                stubber.add_response(
+                    'delete_message_batch', {'Successful': [], 'Failed': []},
+                    {
+                        'QueueUrl': QUEUE_URL,
+                        'Entries': [
+                            {'Id': str(i), 'ReceiptHandle': message['ReceiptHandle']}
+                            for i, message in enumerate(batch)
+                        ]
+                    }
+                )
+
+            changes = queue.receive()
+            stubber.assert_no_pending_responses()
+
+        self.assertEqual(changes, {
+            'EC2': {aws.Target(None, 'eu-west-1'): {'i-0', 'i-1', 'i-2'}},
+            'Lambda': {aws.Target(None, 'eu-west-1'): {'api'}}
+        })
+
+    def test_receive_empty_queue(self):
+        queue = events.EventQueue(QUEUE_URL)
+
+        with Stubber(aws.clients.client('sqs', 'eu-west-1')) as stubber:
+            stubber.add_response('receive_message', {})
+
+            self.assertEqual(queue.receive(), {})
+
+
+class ApplyChangesTest(EventsTestCase):
+    def window(self, items):
+        window = Ec2Window()
+        window.add_page(items)
+        future = concurrent.futures.Future()
+        future.set_result(None)
+        window.apply(future)
+
+        return window
+
+    def test_changes_update_the_listing(self):
+        window = self.window([instance('i-1'), instance('i-2')])
+
+        window.apply_changes([instance('i-1', 'stopped'), instance('i-3')], [(None, 'eu-west-1', 'i-2')])
+
+        self.assertEqual(
+            sorted((item.id, item.state) for item in window._by_key.values()),
+            [('i-1', 'stopped'), ('i-3', 'running')]
+        )
+
+    def test_changes_of_regions_not_shown_are_ignored(self):
+        window = self.window([instance('i-1')])
+
+        window.apply_changes([instance('i-9', region='us-east-1')])
+
+        self.assertEqual([item.id for item in window._by_key.values()], ['i-1'])
+
+    def test_only_shown_regions_are_resolved(self):
+        window = self.window([instance('i-1')])
+
+        with mock.patch.object(aws.Ec2, 'get_instances', autospec=True) as get_instances:
+            get_instances.side_effect = lambda ec2, ids: [instance(i, 'stopped', ec2.region) for i in ids]
+
+            resources, removed = window.resolve_events({
+                aws.Target(None, 'eu-west-1'): {'i-1'},
+                aws.Target(None, 'us-east-1'): {'i-9'}
+            })
+
+        self.assertEqual([call[0][0].region for call in get_instances.call_args_list], ['eu-west-1'])
+        self.assertEqual([(item.id, item.state) for item in resources], [('i-1', 'stopped')])
+        self.assertEqual(removed, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
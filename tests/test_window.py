@@ -0,0 +1,43 @@
+import concurrent.futures
+import os
+import unittest
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'eu-west-1')
+
+from aws_top import aws
+from aws_top.window import Ec2Window
+
+
+def instance(instance_id, state='running', region='eu-west-1'):
+    return aws.Ec2Instance(instance_id, state, 't3.micro', region + 'a', None, region, None)
+
+
+def refresh(window, items):
+    window.add_page(items)
+    future = concurrent.futures.Future()
+    future.set_result(None)
+    window.apply(future)
+
+
+class SortedWindowTest(unittest.TestCase):
+    def setUp(self):
+        aws.set_accounts([])
+        aws.set_region('eu-west-1')
+        self.window = Ec2Window()
+        refresh(self.window, [instance('i-1', 'running'), instance('i-2', 'stopped')])
+        self.window.set_sort('state')
+
+    def ids(self):
+        return [key[-1] for key in self.window.visible_keys()]
+
+    def test_refresh_sorts_added_and_changed_rows(self):
+        refresh(self.window, [instance('i-1', 'stopping'), instance('i-2', 'stopped'), instance('i-3', 'pending')])
+
+        self.assertEqual(self.ids(), ['i-3', 'i-2', 'i-1'])
+
+    def test_refresh_sorts_descending(self):
+        self.window.set_sort('state', descending=True)
+
+        refresh(self.window, [instance('i-1', 'terminated'), instance('i-2', 'stopped'), instance('i-3', 'pending')])
+
+        self.assertEqual(self.ids(), ['i-1', 'i-2', 'i-3'])